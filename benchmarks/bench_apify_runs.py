@@ -0,0 +1,132 @@
+"""
+Wall-clock time for scraping N pages: sequential actor.call vs run lifecycle.
+
+A fake Apify client gives every run a random duration. The old /pages loop
+(scrape_facebook_page + fetch_dataset per page, awaited one after another)
+takes the sum of those durations; stream_facebook_pages starts all runs, polls
+them concurrently and reads datasets in completion order, so it should take
+about as long as the slowest run. One page per run, so batching is not measured.
+The last row uses the default ActorRunLimiter, i.e. the start rate of a plan.
+
+Usage:
+    python benchmarks/bench_apify_runs.py [pages]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp())
+
+import httpx  # noqa: E402
+
+import fb_outreach.apify_service as apify_service  # noqa: E402
+from fb_outreach.apify_service import ActorRunLimiter, ApifyService  # noqa: E402
+from fb_outreach.page_cache import PageScrapeCache  # noqa: E402
+
+MIN_RUN, MAX_RUN = 0.2, 1.0
+
+
+class FakeApify:
+    """Just enough of ApifyClientAsync: actor().call/start, run().wait_for_finish/abort."""
+
+    def __init__(self, durations):
+        self.durations = durations
+        self.runs = {}
+
+    def _new_run(self, run_input):
+        page_id = run_input["startUrls"][0]["url"].rsplit("/", 1)[1]
+        run_id = f"run-{page_id}"
+        self.runs[run_id] = time.monotonic() + self.durations[page_id]
+        return run_id, page_id
+
+    def _state(self, run_id):
+        done = time.monotonic() >= self.runs[run_id]
+        page_id = run_id.split("-", 1)[1]
+        return {"id": run_id, "status": "SUCCEEDED" if done else "RUNNING", "defaultDatasetId": page_id}
+
+    def actor(self, actor_id):
+        fake = self
+
+        class Actor:
+            async def call(self, run_input):
+                run_id, _ = fake._new_run(run_input)
+                await asyncio.sleep(max(0.0, fake.runs[run_id] - time.monotonic()))
+                return fake._state(run_id)
+
+            async def start(self, run_input):
+                run_id, _ = fake._new_run(run_input)
+                return fake._state(run_id)
+
+        return Actor()
+
+    def run(self, run_id):
+        fake = self
+
+        class Run:
+            async def wait_for_finish(self, wait_secs=None):
+                remaining = fake.runs[run_id] - time.monotonic()
+                await asyncio.sleep(max(0.0, min(remaining, wait_secs or remaining)))
+                return fake._state(run_id)
+
+            async def abort(self):
+                fake.runs[run_id] = 0
+
+        return Run()
+
+
+def dataset_handler(request):
+    page_id = request.url.path.split("/")[-2]
+    if int(request.url.params.get("offset", 0)):
+        return httpx.Response(200, json=[])
+    return httpx.Response(200, json=[{"pageAdLibrary": {"id": page_id}, "pageName": f"Page {page_id}"}])
+
+
+async def sequential(service, page_ids):
+    items = 0
+    for page_id in page_ids:
+        run = await service.scrape_facebook_page(page_id)
+        items += len(await service.fetch_dataset(run["defaultDatasetId"]))
+    return items
+
+
+async def lifecycle(service, page_ids):
+    items = 0
+    async for _, _ in service.stream_facebook_pages(page_ids, batch_size=1):
+        items += 1
+    return items
+
+
+async def main(count: int):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(dataset_handler))
+    apify_service.get_http_client = lambda: client
+
+    page_ids = [str(i) for i in range(count)]
+    durations = {page_id: random.uniform(MIN_RUN, MAX_RUN) for page_id in page_ids}
+    print(f"{count} pages, run durations {MIN_RUN}-{MAX_RUN}s "
+          f"(sum {sum(durations.values()):.2f}s, longest {max(durations.values()):.2f}s)")
+
+    unlimited = dict(starts_per_second=1000, burst=count, max_concurrent_runs=count)
+    for name, scrape, limits in (
+        ("sequential call", sequential, unlimited),
+        ("start + poll", lifecycle, unlimited),
+        ("+ plan limiter", lifecycle, {}),
+    ):
+        service = ApifyService(
+            "bench-token",
+            cache=PageScrapeCache(ttl_seconds=0),
+            limiter=ActorRunLimiter(**limits),
+        )
+        service._client = FakeApify(durations)
+        start = time.perf_counter()
+        items = await scrape(service, page_ids)
+        print(f"{name:<16} {items:>4} items  {time.perf_counter() - start:>6.2f}s")
+
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
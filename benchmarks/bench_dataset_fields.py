@@ -0,0 +1,120 @@
+"""
+Bytes downloaded per page-scrape run: full payload vs PAGE_DATASET_FIELDS.
+
+A fake Apify client finishes every run at once; a mock items API serves
+page items shaped like apify/facebook-pages-scraper output (posts, reviews,
+photos and a media block next to the fields save_page reads) and honours the
+`fields` query parameter. The projected row also shows the estimated savings
+that stream_facebook_pages reports per run.
+
+Usage:
+    python benchmarks/bench_dataset_fields.py [pages] [batch_size]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("BLOB_STORE_DIR", tempfile.mkdtemp())
+
+import httpx  # noqa: E402
+
+import fb_outreach.apify_service as apify_service  # noqa: E402
+from fb_outreach.apify_service import ActorRunLimiter, ApifyService, PageBatchResult, project_fields  # noqa: E402
+from fb_outreach.page_cache import PageScrapeCache  # noqa: E402
+
+
+def page_item(page_id: str) -> dict:
+    return {
+        "pageId": page_id,
+        "facebookId": page_id,
+        "pageName": f"Page {page_id}",
+        "title": f"Page {page_id} | Facebook",
+        "facebookUrl": f"https://www.facebook.com/{page_id}",
+        "inputUrl": f"https://www.facebook.com/{page_id}",
+        "profilePictureUrl": f"https://scontent.xx.fbcdn.net/{page_id}/profile.jpg",
+        "coverPhotoUrl": f"https://scontent.xx.fbcdn.net/{page_id}/cover.jpg",
+        "contact": {"email": f"hello@{page_id}.example", "phone": "+1 555 0100"},
+        "websites": [f"https://{page_id}.example"],
+        "likes": 1200, "followers": 1500, "followings": 12,
+        "category": "Shopping & retail", "categories": ["Page", "Shopping & retail"],
+        "intro": "Handmade goods shipped worldwide.",
+        "info": ["Handmade goods shipped worldwide.", "Open daily 9-5"],
+        "rating": "92% recommend (120 Reviews)",
+        "ad_status": "This Page is currently running ads.",
+        "pageAdLibrary": {"id": page_id, "is_business_page_active": True},
+        "media": {
+            "profilePictureUrl": f"https://scontent.xx.fbcdn.net/{page_id}/profile.jpg",
+            "profilePhoto": {"image": {"uri": "https://scontent.xx.fbcdn.net/" + "p" * 400}},
+            "coverPhoto": {"image": {"uri": "https://scontent.xx.fbcdn.net/" + "c" * 400}},
+        },
+        "posts": [{"postId": str(i), "text": "Lorem ipsum dolor sit amet. " * 20} for i in range(10)],
+        "reviews": [{"text": "Great shop, fast delivery! " * 5, "rating": 5} for _ in range(10)],
+        "photos": [{"url": f"https://scontent.xx.fbcdn.net/{page_id}/{i}.jpg"} for i in range(30)],
+    }
+
+
+def dataset_handler(request: httpx.Request) -> httpx.Response:
+    page_ids = request.url.path.split("/")[-2].split("+")
+    offset = int(request.url.params.get("offset", 0))
+    limit = int(request.url.params.get("limit", 500))
+    items = [page_item(page_id) for page_id in page_ids][offset:offset + limit]
+    fields = request.url.params.get("fields")
+    if fields:
+        items = [project_fields(item, fields.split(",")) for item in items]
+    return httpx.Response(200, json=items)
+
+
+class FakeApify:
+    """Runs succeed at once; the dataset id lists the run's page ids."""
+
+    def actor(self, actor_id):
+        class Actor:
+            async def start(self, run_input):
+                page_ids = "+".join(url["url"].rsplit("/", 1)[1] for url in run_input["startUrls"])
+                return {"id": f"run-{page_ids}", "status": "SUCCEEDED", "defaultDatasetId": page_ids}
+
+        return Actor()
+
+    def run(self, run_id):
+        class Run:
+            async def wait_for_finish(self, wait_secs=None):
+                return {"id": run_id, "status": "SUCCEEDED", "defaultDatasetId": run_id.split("-", 1)[1]}
+
+        return Run()
+
+
+async def main(count: int, batch_size: int):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(dataset_handler))
+    apify_service.get_http_client = lambda: client
+    page_ids = [str(i) for i in range(count)]
+
+    print(f"{count} pages, {batch_size} per run")
+    print(f"{'mode':<10} {'runs':>5} {'items':>6} {'downloaded':>11} {'est. saved':>11}")
+    for name, full_payload in (("full", True), ("projected", False)):
+        service = ApifyService(
+            "bench-token",
+            cache=PageScrapeCache(ttl_seconds=0),
+            limiter=ActorRunLimiter(starts_per_second=1000, burst=count, max_concurrent_runs=count),
+            full_payload=full_payload,
+        )
+        service._client = FakeApify()
+        report = PageBatchResult()
+        items = 0
+        # One line per run from ApifyService would drown the table
+        with contextlib.redirect_stdout(io.StringIO()):
+            async for _, _ in service.stream_facebook_pages(page_ids, batch_size, report=report):
+                items += 1
+        print(f"{name:<10} {report.runs:>5} {items:>6} {report.bytes_downloaded:>11} {report.bytes_saved:>11}")
+
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+    ))
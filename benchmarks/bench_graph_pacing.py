@@ -0,0 +1,132 @@
+"""
+Graph API pacing against a local stub server.
+
+The stub mimics ads_archive rate limiting: it allows CAPACITY calls per
+sliding WINDOW seconds, reports the share used in `x-app-usage`, and answers
+429 + Retry-After (error code 4) once the window is full. The same workload is
+run with pacing disabled (old behaviour: only failures back off) and with
+GraphApiPacer.
+
+Usage:
+    python benchmarks/bench_graph_pacing.py [requests] [workers]
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import httpx  # noqa: E402
+
+from fb_outreach.facebook_ads_service import FacebookAdsService  # noqa: E402
+from fb_outreach.ads_cache import AdsResponseCache  # noqa: E402
+from fb_outreach.graph_pacer import GraphApiPacer  # noqa: E402
+
+CAPACITY = 40
+WINDOW = 2.0
+
+
+class StubGraphHandler(BaseHTTPRequestHandler):
+    calls = collections.deque()
+    lock = threading.Lock()
+    throttled = 0
+
+    def do_GET(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and self.calls[0] <= now - WINDOW:
+                self.calls.popleft()
+            if len(self.calls) >= CAPACITY:
+                StubGraphHandler.throttled += 1
+                retry_after = self.calls[0] + WINDOW - now
+                self._reply(429, {"error": {"code": 4, "message": "Application request limit reached"}},
+                            usage=100, retry_after=retry_after)
+                return
+            self.calls.append(now)
+            usage = len(self.calls) * 100 // CAPACITY
+        self._reply(200, {"data": [{"id": "1", "page_id": "p"}]}, usage=usage)
+
+    def _reply(self, status, body, usage, retry_after=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-app-usage", json.dumps({"call_count": usage, "total_cputime": 1, "total_time": 1}))
+        if retry_after is not None:
+            self.send_header("Retry-After", f"{retry_after:.2f}")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class NoPacing(GraphApiPacer):
+    """Stand-in for the old behaviour: nothing is read from responses."""
+
+    def observe(self, response):
+        pass
+
+
+def reset_stub():
+    with StubGraphHandler.lock:
+        StubGraphHandler.calls.clear()
+        StubGraphHandler.throttled = 0
+
+
+async def run(service: FacebookAdsService, url: str, total: int, workers: int):
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+    ok = failed = 0
+
+    async def worker(client):
+        nonlocal ok, failed
+        while not queue.empty():
+            queue.get_nowait()
+            data = await service._get_page(client, url, None, retries=3, backoff=2)
+            if data is None:
+                failed += 1
+            else:
+                ok += 1
+
+    reset_stub()
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        await asyncio.gather(*(worker(client) for _ in range(workers)))
+    elapsed = time.perf_counter() - start
+    return ok, failed, StubGraphHandler.throttled, elapsed
+
+
+def main():
+    # One warning per 429 / pause (and an error per failed call) would drown the table
+    logging.disable(logging.ERROR)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ads_archive"
+
+    print(f"{total} requests, {workers} workers, stub limit {CAPACITY} calls / {WINDOW:.0f}s")
+    print(f"{'mode':<10} {'ok':>5} {'failed':>7} {'429s':>6} {'wall s':>8} {'ok/s':>7}")
+    for name, pacer in (
+        ("no pacing", NoPacing()),
+        # Scaled to the stub's 2 s window; production defaults assume the hour-long Graph window
+        ("pacer", GraphApiPacer(slow_at=60, max_spacing=1.5 * WINDOW / CAPACITY, pause_seconds=WINDOW / 4)),
+    ):
+        service = FacebookAdsService("stub-token", cache=AdsResponseCache(ttl_seconds=0), pacer=pacer)
+        ok, failed, throttled, elapsed = asyncio.run(run(service, url, total, workers))
+        print(f"{name:<10} {ok:>5} {failed:>7} {throttled:>6} {elapsed:>8.2f} {ok / elapsed:>7.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
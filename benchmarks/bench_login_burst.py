@@ -0,0 +1,78 @@
+"""
+Event-loop latency during a burst of logins.
+
+A probe task asks to wake up every 5 ms and records how late it actually
+runs. The burst is run twice: verifying bcrypt inline in the coroutine (the
+old login handler) and through verify_password_async + LoginGovernor.
+
+Usage:
+    python benchmarks/bench_login_burst.py [logins]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fb_outreach.security import (  # noqa: E402
+    LoginGovernor,
+    hash_password,
+    verify_password,
+    verify_password_async,
+)
+
+PROBE_INTERVAL = 0.005
+# Same concurrency cap as the app, but patient enough that the whole burst is served
+governor = LoginGovernor(max_wait_seconds=600)
+
+
+async def probe(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - start - PROBE_INTERVAL) * 1000)
+
+
+async def login_inline(hashed: str):
+    verify_password("correct horse", hashed)
+
+
+async def login_offloaded(hashed: str):
+    async with governor.slot():
+        await verify_password_async("correct horse", hashed)
+
+
+async def run_burst(login, hashed: str, count: int):
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login(hashed) for _ in range(count)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+    return elapsed, lags
+
+
+def report(name: str, elapsed: float, lags):
+    lags = sorted(lags)
+    p99 = lags[int(len(lags) * 0.99) - 1] if len(lags) > 1 else lags[0]
+    print(
+        f"{name:<10} burst {elapsed * 1000:8.1f} ms | loop lag "
+        f"median {statistics.median(lags):7.2f} ms, p99 {p99:7.2f} ms, max {lags[-1]:7.2f} ms"
+    )
+
+
+async def main(count: int):
+    hashed = hash_password("correct horse")
+    report("inline", *await run_burst(login_inline, hashed, count))
+    report("offloaded", *await run_burst(login_offloaded, hashed, count))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
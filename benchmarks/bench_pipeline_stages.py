@@ -0,0 +1,124 @@
+"""
+Time to first pitch and wall time: phased pipeline vs staged pipeline_run.
+
+Fakes stand in for the Ads Library (one page of ads per PAGE_DELAY), Apify
+(a random scrape duration per page) and the LLM (PITCH_DELAY per pitch).
+Everything else is the real pipeline: PipelineContext, the memory store,
+prospect building and pitch persistence.
+
+"phased" is the old pipeline_run: gather every process_ad, then
+build_prospects over the store, then one pitch after another. "staged" is
+the current pipeline_run with its default worker counts and queue size.
+
+Usage:
+    python benchmarks/bench_pipeline_stages.py [ads]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("BLOB_STORE_DIR", os.path.join(_tmp, "blobs"))
+os.environ.setdefault("MEMORY_STORE_PATH", os.path.join(_tmp, "memory.log"))
+
+import fb_outreach.outreach_pipeline as outreach_pipeline  # noqa: E402
+from fb_outreach.custom_memory_session import PipelineContext  # noqa: E402
+from fb_outreach.prospect_builder import build_prospects  # noqa: E402
+
+ADS_PER_PAGE = 10
+PAGE_DELAY = 0.05
+MIN_SCRAPE, MAX_SCRAPE = 0.2, 1.0
+PITCH_DELAY = 0.3
+
+
+class FakeAdsService:
+    def __init__(self, count: int):
+        self.count = count
+
+    async def iter_ad_pages(self, req, max_ads=None, **kwargs):
+        for start in range(0, self.count, ADS_PER_PAGE):
+            await asyncio.sleep(PAGE_DELAY)
+            yield [
+                {"id": f"ad-{i}", "page_id": f"p{i}", "page_name": f"Page {i}", "ad_creative_bodies": "Buy now"}
+                for i in range(start, min(start + ADS_PER_PAGE, self.count))
+            ], None
+
+
+class FakeApifyService:
+    def __init__(self, durations):
+        self.durations = durations
+
+    async def stream_facebook_pages(self, page_ids, report=None, **kwargs):
+        for page_id in page_ids:
+            await asyncio.sleep(self.durations[page_id])
+            yield page_id, {
+                "pageId": page_id,
+                "pageName": f"Page {page_id}",
+                "contact": {"email": f"hello@{page_id}.example.com"},
+                "intro": "Organic food delivery",
+                "pageAdLibrary": {"id": page_id},
+            }
+
+
+class FakePitchService:
+    async def generate_pitch(self, *, user_input, context):
+        await asyncio.sleep(PITCH_DELAY)
+        return f"Hi {context.page_name}"
+
+
+async def phased(user_id: str, count: int, pitch_service) -> dict:
+    """The pipeline before stages, minus the Graph/LLM clients."""
+    started = time.perf_counter()
+    first_pitch = None
+    async with PipelineContext(user_id=user_id) as ctx:
+        results = {"total": 0, "success": 0, "failed": 0, "skipped": 0}
+        tasks = []
+        async for page_ads, paging in FakeAdsService(count).iter_ad_pages(None):
+            for ad in page_ads:
+                results["total"] += 1
+                tasks.append(asyncio.create_task(
+                    outreach_pipeline.process_ad(results["total"], ad, results, ctx, paging)
+                ))
+        await asyncio.gather(*tasks)
+        await ctx.flush()
+        prospects, _ = build_prospects(user_id)
+        for prospect in prospects:
+            pitch = await pitch_service.generate_pitch(user_input="", context=prospect)
+            await ctx.save_pitch(page_id=prospect.page_id, email=prospect.email, content=pitch)
+            results["success"] += 1
+            if first_pitch is None:
+                first_pitch = time.perf_counter() - started
+    results["time_to_first_pitch_seconds"] = first_pitch
+    results["wall_seconds"] = time.perf_counter() - started
+    return results
+
+
+async def staged(user_id: str, count: int, pitch_service) -> dict:
+    outreach_pipeline.FacebookAdsService = lambda access_token: FakeAdsService(count)
+    return await outreach_pipeline.pipeline_run(user_id=user_id, max_ads=count, pitch_service=pitch_service)
+
+
+async def main(count: int):
+    durations = {f"p{i}": random.uniform(MIN_SCRAPE, MAX_SCRAPE) for i in range(count)}
+    apify = FakeApifyService(durations)
+    outreach_pipeline.get_apify_service = lambda: apify
+
+    print(f"{count} ads, scrape {MIN_SCRAPE}-{MAX_SCRAPE}s, pitch {PITCH_DELAY}s, "
+          f"{outreach_pipeline.SCRAPE_WORKERS} scrape / {outreach_pipeline.PITCH_WORKERS} pitch workers")
+    print(f"{'mode':<8} {'pitches':>8} {'first pitch s':>14} {'wall s':>8}")
+    for name, run in (("phased", phased), ("staged", staged)):
+        # The pipeline prints every ad, page and prospect
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = await run(f"bench-{name}-{time.time_ns()}", count, FakePitchService())
+        print(f"{name:<8} {results['success']:>8} {results['time_to_first_pitch_seconds']:>14.2f} "
+              f"{results['wall_seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 40))
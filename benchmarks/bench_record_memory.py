@@ -0,0 +1,81 @@
+"""
+Per-record memory of stored page records, before and after __slots__.
+
+"Before" is an equivalent plain @dataclass (per-instance __dict__) built
+from the same fields; "after" is the slotted record used by the store.
+Each page is wrapped in a BufferItem, as it is in ShortTermMemory.
+
+Usage:
+    python benchmarks/bench_record_memory.py [count]
+"""
+import os
+import sys
+import tracemalloc
+from dataclasses import dataclass, field, fields, make_dataclass
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fb_outreach.memory_storage import BufferItem  # noqa: E402
+from fb_outreach.schemas import ApifyFacebookPageData  # noqa: E402
+
+
+def _plain_copy(cls):
+    """Same fields and defaults as `cls`, but without slots."""
+    spec = [(f.name, f.type, field(default=f.default, default_factory=f.default_factory)) for f in fields(cls)]
+    return make_dataclass(f"Plain{cls.__name__}", spec)
+
+
+PlainPage = _plain_copy(ApifyFacebookPageData)
+
+
+@dataclass
+class PlainBufferItem:
+    data: object
+    user_id: str
+    run_id: str
+    timestamp: str
+
+
+# Shared across records so only the record layout itself is measured
+RAW_DATA = {"pageId": "123", "pageName": "Example"}
+
+
+def build(page_cls, item_cls, count: int):
+    return [
+        item_cls(
+            data=page_cls(
+                page_id=str(i),
+                page_name=f"Page {i}",
+                email=f"contact{i}@example.com",
+                likes=i,
+                followers=i * 2,
+                category="Health & wellness",
+                raw_data=RAW_DATA,
+            ),
+            user_id="bench_user",
+            run_id="bench_run",
+            timestamp="2025-01-01 00:00:00",
+        )
+        for i in range(count)
+    ]
+
+
+def measure(page_cls, item_cls, count: int) -> float:
+    tracemalloc.start()
+    records = build(page_cls, item_cls, count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    before = measure(PlainPage, PlainBufferItem, count)
+    after = measure(ApifyFacebookPageData, BufferItem, count)
+
+    print(f"records: {count}")
+    print(f"before (__dict__): {before:8.1f} bytes/record")
+    print(f"after (__slots__): {after:8.1f} bytes/record")
+    print(f"saved:             {before - after:8.1f} bytes/record ({(1 - after / before) * 100:.1f}%)")
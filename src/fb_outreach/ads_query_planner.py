@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+
+from fb_outreach.facebook_ads_service import FacebookAdsService, cache_key, drop_known_ads, normalize_values
+from fb_outreach.http_client import get_http_client
+from fb_outreach.schemas import AdsQueryWatermark, AdsRequest
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("ADS_FANOUT_CONCURRENCY", "4"))
+
+
+@dataclass
+class SubQueryReport:
+    search_term: str
+    country: str
+    ads: int = 0
+    pages: int = 0
+    elapsed_ms: float = 0.0
+    error: Optional[str] = None
+    cached: bool = False
+
+
+@dataclass
+class FanOutResult:
+    ads: List[Dict[str, Any]] = field(default_factory=list)
+    sub_queries: List[SubQueryReport] = field(default_factory=list)
+    duplicates_dropped: int = 0
+    known_skipped: int = 0
+    elapsed_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "data": self.ads,
+            "duplicates_dropped": self.duplicates_dropped,
+            "known_skipped": self.known_skipped,
+            "elapsed_ms": round(self.elapsed_ms, 1),
+            "sub_queries": [
+                {
+                    "search_term": report.search_term,
+                    "country": report.country,
+                    "ads": report.ads,
+                    "pages": report.pages,
+                    "elapsed_ms": round(report.elapsed_ms, 1),
+                    "error": report.error,
+                    "cached": report.cached,
+                }
+                for report in self.sub_queries
+            ],
+        }
+
+
+def plan_sub_queries(req: AdsRequest) -> List[AdsRequest]:
+    """
+    Split a multi-term, multi-country request into one request per (term, country).
+    Each sub-query keeps the caller's limit and date range, so a broad campaign
+    is no longer truncated to a single `limit` across every combination.
+    """
+    terms = list(dict.fromkeys(normalize_values(req.search_terms)))
+    countries = list(dict.fromkeys(normalize_values(req.ad_reached_countries)))
+    return [
+        req.model_copy(update={"search_terms": term, "ad_reached_countries": country})
+        for term in terms
+        for country in countries
+    ]
+
+
+def merge_ads(
+    batches: List[List[Dict[str, Any]]],
+    unique_pages: bool = True,
+) -> tuple[List[Dict[str, Any]], int]:
+    """
+    Merge sub-query results in plan order, dropping repeated ad ids and,
+    when `unique_pages` is set, further ads from a page_id already kept.
+    Returns (ads, duplicates_dropped).
+    """
+    seen_ads: Set[str] = set()
+    seen_pages: Set[str] = set()
+    merged: List[Dict[str, Any]] = []
+    dropped = 0
+
+    for batch in batches:
+        for ad in batch:
+            ad_id = ad.get("id")
+            page_id = ad.get("page_id")
+            if ad_id and ad_id in seen_ads:
+                dropped += 1
+                continue
+            if unique_pages and page_id and page_id in seen_pages:
+                dropped += 1
+                continue
+            if ad_id:
+                seen_ads.add(ad_id)
+            if page_id:
+                seen_pages.add(page_id)
+            merged.append(ad)
+
+    return merged, dropped
+
+
+async def fetch_ads_fanout(
+    service: FacebookAdsService,
+    req: AdsRequest,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    max_pages_per_query: Optional[int] = 1,
+    unique_pages: bool = True,
+    client: Optional[httpx.AsyncClient] = None,
+    watermark: Optional[AdsQueryWatermark] = None,
+) -> FanOutResult:
+    """
+    Run every (term, country) sub-query concurrently, at most `max_concurrency`
+    in flight, and merge the results deduplicated by ad id and page_id.
+    A failing sub-query is reported in its SubQueryReport and does not sink the rest;
+    successful ones are kept in the service's response cache.
+    With a `watermark`, sub-queries start at its date and already known ads are dropped.
+    """
+    sub_queries = plan_sub_queries(req)
+    client = client or get_http_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    started = time.perf_counter()
+
+    async def run(sub_req: AdsRequest) -> tuple[SubQueryReport, List[Dict[str, Any]]]:
+        report = SubQueryReport(search_term=sub_req.search_terms, country=sub_req.ad_reached_countries)
+        sub_req = service.since_watermark(sub_req, watermark)
+        if sub_req is None:
+            return report, []
+        key = cache_key(sub_req, "pages", max_pages_per_query)
+        cached = service.cache.get(key)
+        if cached is not None:
+            ads, report.pages = cached
+            report.cached = True
+            report.ads = len(ads)
+            return report, ads
+
+        ads: List[Dict[str, Any]] = []
+        async with semaphore:
+            sub_started = time.perf_counter()
+            try:
+                async for page_ads, _ in service.iter_ad_pages(
+                    sub_req,
+                    max_ads=sub_req.limit * max_pages_per_query if max_pages_per_query else None,
+                    max_pages=max_pages_per_query,
+                    client=client,
+                ):
+                    ads.extend(page_ads)
+                    report.pages += 1
+            except Exception as e:
+                report.error = str(e)
+            report.elapsed_ms = (time.perf_counter() - sub_started) * 1000
+        if report.error is None and report.pages:
+            service.cache.put(key, (ads, report.pages))
+        report.ads = len(ads)
+        logger.info(
+            f"Sub-query term={report.search_term!r} country={report.country} "
+            f"-> {report.ads} ads in {report.elapsed_ms:.0f}ms"
+        )
+        return report, ads
+
+    outcomes = await asyncio.gather(*(run(sub_req) for sub_req in sub_queries))
+
+    # Cached sub-query answers are shared, so known ads are filtered only here
+    batches = [drop_known_ads(ads, watermark) for _, ads in outcomes]
+    known_skipped = sum(len(ads) for _, ads in outcomes) - sum(len(ads) for ads in batches)
+    merged, dropped = merge_ads(batches, unique_pages=unique_pages)
+    return FanOutResult(
+        ads=merged,
+        sub_queries=[report for report, _ in outcomes],
+        duplicates_dropped=dropped,
+        known_skipped=known_skipped,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
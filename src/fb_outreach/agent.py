@@ -159,10 +159,13 @@ from agents import AsyncOpenAI, OpenAIChatCompletionsModel
 from agents import set_default_openai_client, set_tracing_disabled
 
 from dataclasses import dataclass
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 
 import os
 
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+PITCH_MODEL = os.getenv("PITCH_MODEL", "gemini-2.5-flash")
+
 @dataclass
 class UserData:
     page_name: str
@@ -314,6 +317,35 @@ class PitchService:
             return ""
 
 
+# Process-wide instance: one LLM client and agent shared by every pipeline run
+_shared_pitch_service: Optional[PitchService] = None
+
+
+def get_pitch_service() -> Optional[PitchService]:
+    """
+    Return the shared PitchService, creating it on first use.
+    None when GEMINI_API_KEY is not set.
+    """
+    global _shared_pitch_service
+    if _shared_pitch_service is None:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            return None
+        client = AsyncOpenAI(api_key=api_key, base_url=GEMINI_BASE_URL)
+        model = OpenAIChatCompletionsModel(model=PITCH_MODEL, openai_client=client)
+        _shared_pitch_service = PitchService(
+            pitch_agent=Agent(name="Pitch Agent", instructions=pitch_prompt),
+            run_config=RunConfig(model=model, tracing_disabled=True),
+        )
+    return _shared_pitch_service
+
+
+def close_pitch_service() -> None:
+    """Drop the shared PitchService (call on application shutdown)."""
+    global _shared_pitch_service
+    _shared_pitch_service = None
+
+
 # # New AI client aur model bana lo
 # client = AsyncOpenAI(api_key="YOUR_KEY", base_url="...")
 # model = OpenAIChatCompletionsModel(model="new-model", openai_client=client)
@@ -1,13 +1,197 @@
+import asyncio
+import json
 import os
-import requests
-from typing import Any, Dict, Optional
+import time
+import threading
+from contextlib import aclosing, asynccontextmanager
+import httpx
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
 from apify_client import ApifyClientAsync
 from dotenv import load_dotenv
+from fb_outreach.http_client import get_http_client, DEFAULT_TIMEOUT
+from fb_outreach.blob_store import LazyPayload
+from fb_outreach.page_cache import PageScrapeCache, page_cache
 
 load_dotenv()
 
 BASE_URL = "https://api.apify.com/v2/datasets"
 HEADERS = {"Accept": "application/json"}
+PAGES_ACTOR = "apify/facebook-pages-scraper"
+# Page ids packed into one actor run; actor startup dominates a single-page run
+DEFAULT_BATCH_SIZE = int(os.getenv("APIFY_BATCH_SIZE", "25"))
+DEFAULT_DATASET_PAGE_SIZE = 500
+DEFAULT_RUN_TIMEOUT = float(os.getenv("APIFY_RUN_TIMEOUT_SECONDS", "600"))
+# Server-side long poll per status request (Apify caps waitForFinish at 60 s)
+RUN_POLL_SECONDS = 30
+TERMINAL_RUN_STATUSES = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+# Top-level keys read by PipelineContext.save_page, match_page_id and prospect_builder.
+# `media` is left out: save_page falls back to the top-level picture URLs.
+# The stored item is also the page half of ProspectContext.raw_data, which the
+# pitch prompt shows as "extras", so the short descriptive fields stay in too.
+# Posts, reviews, photos and media no longer reach the prompt unless
+# APIFY_FULL_PAYLOAD is set.
+PAGE_PROMPT_FIELDS = (
+    "address", "email", "phone", "website", "about_me", "services", "priceRange",
+    "ratingOverall", "ratingCount",
+)
+PAGE_DATASET_FIELDS = (
+    "pageId", "facebookId", "pageName", "title", "facebookUrl", "pageUrl", "inputUrl", "url",
+    "profilePictureUrl", "coverPhotoUrl", "contact", "websites", "likes", "followers",
+    "followings", "category", "categories", "intro", "info", "creation_date", "creationDate",
+    "rating", "ad_status", "pageAdLibrary",
+    *PAGE_PROMPT_FIELDS,
+)
+# Download every field (audits); otherwise datasets are read with PAGE_DATASET_FIELDS
+FULL_PAYLOAD = os.getenv("APIFY_FULL_PAYLOAD", "false").lower() in ("1", "true", "yes")
+# Every Nth projected run also downloads one full item to estimate the bytes saved
+PAYLOAD_SAMPLE_EVERY = int(os.getenv("APIFY_PAYLOAD_SAMPLE_EVERY", "20"))
+
+
+def page_url(page_id: str) -> str:
+    return f"https://www.facebook.com/{page_id}"
+
+
+def _ids_from_url(url: Any) -> List[str]:
+    """Candidate page ids in a Facebook URL: ?id=... and the first path segment."""
+    if not isinstance(url, str) or not url:
+        return []
+    parts = urlsplit(url)
+    candidates = parse_qs(parts.query).get("id", [])
+    segments = [segment for segment in parts.path.split("/") if segment]
+    if segments:
+        candidates.append(segments[0])
+    return candidates
+
+
+def match_page_id(item: Dict[str, Any], requested: Set[str]) -> Optional[str]:
+    """
+    Which requested page id a dataset item belongs to.
+    Tries pageAdLibrary.id (the id Graph ads carry), then pageId / facebookId,
+    then the input and page URLs.
+    """
+    ad_library = item.get("pageAdLibrary") or {}
+    candidates = [ad_library.get("id"), item.get("pageId"), item.get("facebookId")]
+    for key in ("inputUrl", "facebookUrl", "pageUrl", "url"):
+        candidates.extend(_ids_from_url(item.get(key)))
+    for candidate in candidates:
+        if candidate is not None and str(candidate) in requested:
+            return str(candidate)
+    return None
+
+
+class ActorRunLimiter:
+    """
+    Caps actor runs to what the Apify plan allows.
+
+    - Token bucket on run starts: `starts_per_second` sustained, `burst` at once.
+    - At most `max_concurrent_runs` runs alive at a time; a slot is held from
+      start until the run reaches a terminal status.
+    """
+
+    def __init__(self, starts_per_second: float = 2.0, burst: int = 5, max_concurrent_runs: int = 25):
+        self.starts_per_second = starts_per_second
+        self.burst = burst
+        self.max_concurrent_runs = max_concurrent_runs
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = asyncio.Semaphore(max_concurrent_runs)
+
+    def _reserve_token(self) -> float:
+        """Take a start token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.starts_per_second)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance is a queue: wait until it has been refilled
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.starts_per_second
+
+    async def acquire(self) -> None:
+        await self._slots.acquire()
+        try:
+            delay = self._reserve_token()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self) -> None:
+        self._slots.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+async def _cancel_all(tasks: List["asyncio.Task"]) -> None:
+    """Cancel tasks and wait for them, so cancelled runs get aborted before we move on."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def project_fields(item: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """What a `fields` projection of the Apify items API returns for `item`."""
+    return {key: item[key] for key in fields if key in item}
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode())
+
+
+def _plain(item: Any) -> Dict[str, Any]:
+    """Cached items are blob-store references; callers get the decoded dict."""
+    return item.value if isinstance(item, LazyPayload) else item
+
+
+@dataclass
+class DatasetTransfer:
+    """
+    Bytes downloaded for one run's dataset. full_bytes is what the whole payload
+    would have cost: exact for full-payload reads, estimated from sampled items
+    for projected ones (None until a sample exists).
+    """
+    run_id: str
+    dataset_id: str
+    projected: bool
+    items: int = 0
+    bytes_downloaded: int = 0
+    full_bytes: Optional[int] = None
+
+    @property
+    def bytes_saved(self) -> int:
+        if self.full_bytes is None:
+            return 0
+        return max(0, self.full_bytes - self.bytes_downloaded)
+
+
+@dataclass
+class PageBatchResult:
+    """Outcome of scrape_facebook_pages: items per page id plus what went wrong."""
+    items: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    unmatched: List[Dict[str, Any]] = field(default_factory=list)
+    unmatched_count: int = 0
+    runs: int = 0
+    run_ids: List[str] = field(default_factory=list)
+    cached: int = 0
+    transfers: List[DatasetTransfer] = field(default_factory=list)
+
+    @property
+    def bytes_downloaded(self) -> int:
+        return sum(transfer.bytes_downloaded for transfer in self.transfers)
+
+    @property
+    def bytes_saved(self) -> int:
+        return sum(transfer.bytes_saved for transfer in self.transfers)
 
 class ApifyService:
     """
@@ -17,11 +201,32 @@ class ApifyService:
     - Dataset fetching
     """
 
-    def __init__(self, api_token: Optional[str] = None):
+    def __init__(
+        self,
+        api_token: Optional[str] = None,
+        cache: Optional[PageScrapeCache] = None,
+        limiter: Optional[ActorRunLimiter] = None,
+        full_payload: bool = FULL_PAYLOAD,
+        sample_every: int = PAYLOAD_SAMPLE_EVERY,
+    ):
         self.api_token = api_token
         if not self.api_token:
             raise RuntimeError("APIFY_API_KEY is missing")
         self._client: Optional[ApifyClientAsync] = None
+        self.cache = cache if cache is not None else page_cache
+        self.limiter = limiter if limiter is not None else ActorRunLimiter(
+            starts_per_second=float(os.getenv("APIFY_STARTS_PER_SECOND", "2")),
+            burst=int(os.getenv("APIFY_START_BURST", "5")),
+            max_concurrent_runs=int(os.getenv("APIFY_MAX_CONCURRENT_RUNS", "25")),
+        )
+        self.full_payload = full_payload
+        self.sample_every = max(1, sample_every)
+        # Sizes of sampled full items and of their projections, for savings estimates
+        self._sampled_full_bytes = 0
+        self._sampled_projected_bytes = 0
+        self._projected_runs = 0
+        # launch_runs tasks still going, cancelled (and their runs aborted) by close()
+        self._run_tasks: Set["asyncio.Task"] = set()
 
     @property
     def client(self) -> ApifyClientAsync:
@@ -36,35 +241,385 @@ class ApifyService:
         Calls Apify Facebook Pages Scraper actor for a given page_id.
         Returns the scraped data as a dictionary.
         """
-        actor = self.client.actor("apify/facebook-pages-scraper")
+        actor = self.client.actor(PAGES_ACTOR)
         run_input = {
-            "startUrls": [{"url": f"https://www.facebook.com/{page_id}"}]
+            "startUrls": [{"url": page_url(page_id)}]
         }
 
         try:
-            result = await actor.call(run_input=run_input)
+            async with self.limiter.slot():
+                result = await actor.call(run_input=run_input)
             return result
         except Exception as e:
             raise RuntimeError(f"Failed to scrape page {page_id}: {e}")
 
+    # ----------------- Run lifecycle -----------------
+    async def start_run(self, run_input: Dict[str, Any], actor_id: str = PAGES_ACTOR) -> Dict[str, Any]:
+        """
+        Starts an actor run and returns its run object right away
+        (unlike actor.call, which holds the coroutine until the run ends).
+        """
+        run = await self.client.actor(actor_id).start(run_input=run_input)
+        if not run:
+            raise RuntimeError(f"actor {actor_id} did not start")
+        return run
+
+    async def wait_for_run(
+        self,
+        run_id: str,
+        timeout: Optional[float] = DEFAULT_RUN_TIMEOUT,
+        poll_seconds: int = RUN_POLL_SECONDS,
+    ) -> Dict[str, Any]:
+        """
+        Long-polls a run until it reaches a terminal status.
+        Returns the finished run; raises if it did not succeed or `timeout` passed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        run_client = self.client.run(run_id)
+        while True:
+            wait_secs = poll_seconds
+            if deadline is not None:
+                wait_secs = max(1, min(poll_seconds, int(deadline - time.monotonic())))
+            run = await run_client.wait_for_finish(wait_secs=wait_secs)
+            status = run.get("status") if run else None
+            if status in TERMINAL_RUN_STATUSES:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"actor run {run_id} still {status} after {timeout}s")
+
+        if status != "SUCCEEDED":
+            raise RuntimeError(f"actor run {run_id} ended {status}")
+        return run
+
+    async def abort_run(self, run_id: str) -> None:
+        try:
+            await self.client.run(run_id).abort()
+        except Exception as e:
+            print(f"[ApifyService] Could not abort run {run_id}: {e}")
+
+    async def run_to_completion(self, run_input: Dict[str, Any], actor_id: str = PAGES_ACTOR) -> Dict[str, Any]:
+        """
+        Start + wait inside one limiter slot. A cancelled caller or a run that
+        outlives its timeout is aborted instead of left running (and billing)
+        on Apify; the slot is only released once the abort went through, so
+        APIFY_MAX_CONCURRENT_RUNS also bounds runs still winding down.
+        """
+        await self.limiter.acquire()
+        run_id = None
+        try:
+            run = await self.start_run(run_input, actor_id)
+            run_id = run["id"]
+            return await self.wait_for_run(run_id)
+        except (asyncio.CancelledError, TimeoutError):
+            if run_id is not None:
+                await self.abort_run(run_id)
+            raise
+        finally:
+            self.limiter.release()
+
+    def launch_runs(
+        self,
+        jobs: List[Tuple[Any, Dict[str, Any]]],
+        actor_id: str = PAGES_ACTOR,
+    ) -> List["asyncio.Task"]:
+        """
+        Schedules every (tag, run_input) job right away; each task starts its
+        run as soon as the limiter allows and resolves to (tag, finished_run, error).
+        """
+        async def track(tag: Any, run_input: Dict[str, Any]):
+            try:
+                return tag, await self.run_to_completion(run_input, actor_id), None
+            except Exception as e:
+                return tag, None, e
+
+        tasks = [asyncio.ensure_future(track(tag, run_input)) for tag, run_input in jobs]
+        for task in tasks:
+            self._run_tasks.add(task)
+            task.add_done_callback(self._run_tasks.discard)
+        return tasks
+
+    async def close(self) -> None:
+        """Abort the runs launch_runs still has going, then close the Apify client."""
+        await _cancel_all(list(self._run_tasks))
+        client, self._client = self._client, None
+        if client is None:
+            return
+        http_client = client.http_client
+        if hasattr(http_client, "aclose"):
+            await http_client.aclose()
+        else:
+            # apify-client 2.x has no close; shut the impit client it wraps
+            await http_client.impit_async_client.__aexit__(None, None, None)
+
+    async def iter_completed_runs(
+        self,
+        tasks: List["asyncio.Task"],
+    ) -> AsyncIterator[Tuple[Any, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Yields launch_runs results in completion order, so N runs take about
+        as long as the slowest one. Runs still going when the caller stops
+        iterating are aborted.
+        """
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            await _cancel_all(tasks)
+
+    async def stream_facebook_pages(
+        self,
+        page_ids: Iterable[str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        report: Optional[PageBatchResult] = None,
+        full_payload: Optional[bool] = None,
+    ) -> AsyncIterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Scrapes many pages with one actor run per `batch_size` page ids and
+        yields (page_id, item) while each run's dataset is paged in.
+        page_id is None for items that match no requested id (see match_page_id).
+        Pages fresh in self.cache, or being scraped by another caller, are not
+        scraped again. Runs, failed ids, cache and byte savings go to `report`.
+
+        Items carry PAGE_DATASET_FIELDS only, unless `full_payload` (default:
+        self.full_payload) asks for every field; full-payload scrapes bypass the
+        cache, which holds projected items.
+        """
+        report = report if report is not None else PageBatchResult()
+        fields = self.dataset_fields(full_payload)
+        cache = self.cache if fields is not None else PageScrapeCache(ttl_seconds=0)
+        unique_ids = list(dict.fromkeys(str(page_id) for page_id in page_ids if page_id))
+
+        cached: List[Tuple[str, List[Any]]] = []
+        waiting: List[Tuple[str, asyncio.Future]] = []
+        to_scrape: List[str] = []
+        for page_id in unique_ids:
+            items, future = cache.lookup(page_id)
+            if items is not None:
+                cached.append((page_id, items))
+            elif future is not None:
+                waiting.append((page_id, future))
+            else:
+                cache.claim(page_id)
+                to_scrape.append(page_id)
+        report.cached += len(cached)
+
+        batches = [to_scrape[i:i + batch_size] for i in range(0, len(to_scrape), batch_size)]
+        report.runs += len(batches)
+
+        def fail(batch: List[str], error: Any):
+            for page_id in batch:
+                report.failed[page_id] = str(error)
+                cache.resolve(page_id, None)
+                unresolved.discard(page_id)
+
+        unresolved = set(to_scrape)
+        jobs = [
+            (batch, {"startUrls": [{"url": page_url(page_id)} for page_id in batch]})
+            for batch in batches
+        ]
+        # Runs start (as fast as the limiter allows) before cached pages are handed out
+        tasks = self.launch_runs(jobs)
+        try:
+            for page_id, items in cached:
+                for item in items:
+                    yield page_id, _plain(item)
+
+            # Datasets are read in the order runs finish
+            async with aclosing(self.iter_completed_runs(tasks)) as completed_runs:
+                async for batch, run, error in completed_runs:
+                    if error is not None:
+                        fail(batch, error)
+                        continue
+                    report.run_ids.append(run["id"])
+
+                    requested = set(batch)
+                    scraped: Dict[str, List[Dict[str, Any]]] = {}
+                    transfer = DatasetTransfer(run["id"], run["defaultDatasetId"], projected=fields is not None)
+                    report.transfers.append(transfer)
+                    try:
+                        async for item in self.iter_dataset(transfer.dataset_id, fields=fields, transfer=transfer):
+                            if fields is None:
+                                self._record_sample(item)
+                            page_id = match_page_id(item, requested)
+                            if page_id is None and len(batch) == 1:
+                                # A single-page run can only have scraped that page
+                                page_id = batch[0]
+                            if page_id is None:
+                                report.unmatched_count += 1
+                            else:
+                                scraped.setdefault(page_id, []).append(item)
+                            yield page_id, item
+                    except httpx.HTTPError as e:
+                        error = f"dataset {run['defaultDatasetId']} could not be fetched: {e}"
+                    if error is None:
+                        await self._estimate_full_bytes(transfer)
+                        print(
+                            f"[ApifyService] run {transfer.run_id}: {transfer.items} items, "
+                            f"{transfer.bytes_downloaded} bytes downloaded, ~{transfer.bytes_saved} bytes saved"
+                        )
+                    for page_id in batch:
+                        if page_id not in scraped:
+                            report.failed[page_id] = error or "no dataset item for page"
+                        cache.resolve(page_id, scraped.get(page_id) if error is None else None)
+                        unresolved.discard(page_id)
+
+            for page_id, future in waiting:
+                items = await cache.wait(future)
+                if not items:
+                    report.failed[page_id] = "shared scrape of this page failed"
+                    continue
+                report.cached += 1
+                for item in items:
+                    yield page_id, _plain(item)
+        finally:
+            await _cancel_all(tasks)
+            # Never leave other callers waiting on a scrape we abandoned
+            for page_id in unresolved:
+                cache.resolve(page_id, None)
+
+    async def scrape_facebook_pages(
+        self,
+        page_ids: Iterable[str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        full_payload: Optional[bool] = None,
+    ) -> PageBatchResult:
+        """
+        Collecting variant of stream_facebook_pages: items grouped per page id,
+        unmatched ones in `unmatched`.
+        """
+        result = PageBatchResult()
+        async for page_id, item in self.stream_facebook_pages(
+            page_ids, batch_size, report=result, full_payload=full_payload
+        ):
+            if page_id is None:
+                result.unmatched.append(item)
+            else:
+                result.items.setdefault(page_id, []).append(item)
+        return result
+
     # ----------------- Dataset Fetching -----------------
-    async def fetch_dataset(self, dataset_id: str, timeout: int = 10) -> Optional[Dict[str, Any]]:
+    def dataset_fields(self, full_payload: Optional[bool] = None) -> Optional[Tuple[str, ...]]:
+        """Fields to request from page datasets; None means the full payload."""
+        full_payload = self.full_payload if full_payload is None else full_payload
+        return None if full_payload else PAGE_DATASET_FIELDS
+
+    async def iter_dataset(
+        self,
+        dataset_id: str,
+        page_size: int = DEFAULT_DATASET_PAGE_SIZE,
+        timeout: Optional[float] = None,
+        fields: Optional[Sequence[str]] = PAGE_DATASET_FIELDS,
+        transfer: Optional[DatasetTransfer] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Fetches all items from an Apify dataset.
-        Returns JSON data or None on failure.
+        Streams the items of an Apify dataset, `page_size` items per request
+        (offset/limit), so at most one page is held in memory.
+        Only `fields` are downloaded (None: every field); items and response
+        bytes are counted on `transfer`.
+        Raises httpx.HTTPError on failure.
         """
+        client = get_http_client()
         dataset_url = f"{BASE_URL}/{dataset_id}/items"
-        params = {"token": self.api_token}
+        # Token in a header keeps it out of URLs and logs
+        headers = {**HEADERS, "Authorization": f"Bearer {self.api_token}"}
+        params: Dict[str, Any] = {"limit": page_size, "clean": "true"}
+        if fields:
+            params["fields"] = ",".join(fields)
+        offset = 0
 
-        try:
-            response = requests.get(dataset_url, params=params, headers=HEADERS, timeout=timeout)
+        while True:
+            response = await client.get(
+                dataset_url,
+                params={**params, "offset": offset},
+                headers=headers,
+                timeout=timeout if timeout is not None else DEFAULT_TIMEOUT,
+            )
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
+            items = response.json()
+            if transfer is not None:
+                transfer.items += len(items)
+                transfer.bytes_downloaded += len(response.content)
+            for item in items:
+                yield item
+
+            offset += len(items)
+            total = response.headers.get("x-apify-pagination-total")
+            if len(items) < page_size or (total is not None and offset >= int(total)):
+                return
+
+    async def fetch_dataset(
+        self,
+        dataset_id: str,
+        timeout: Optional[float] = None,
+        full_payload: Optional[bool] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetches all items from an Apify dataset (PAGE_DATASET_FIELDS unless full_payload).
+        Returns the item list or None on failure; prefer iter_dataset for large datasets.
+        """
+        fields = self.dataset_fields(full_payload)
+        try:
+            return [item async for item in self.iter_dataset(dataset_id, timeout=timeout, fields=fields)]
+        except httpx.TimeoutException:
             print(f"[ApifyService] Request to dataset {dataset_id} timed out")
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             print(f"[ApifyService] HTTP error ({e.response.status_code}) for dataset {dataset_id}")
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"[ApifyService] Request failed for dataset {dataset_id}: {e}")
 
         return None
+
+    # ----------------- Byte savings -----------------
+    def _record_sample(self, item: Dict[str, Any]) -> None:
+        self._sampled_full_bytes += _json_size(item)
+        self._sampled_projected_bytes += _json_size(project_fields(item, PAGE_DATASET_FIELDS))
+
+    async def _estimate_full_bytes(self, transfer: DatasetTransfer) -> None:
+        """
+        Fills transfer.full_bytes. Projected runs scale their download by the
+        full/projected size ratio of sampled items; every `sample_every`th one
+        (and the first) downloads one full item to refresh that ratio.
+        """
+        if not transfer.projected:
+            transfer.full_bytes = transfer.bytes_downloaded
+            return
+
+        sample = None
+        if transfer.items and (not self._sampled_projected_bytes or self._projected_runs % self.sample_every == 0):
+            sample = DatasetTransfer(transfer.run_id, transfer.dataset_id, projected=False)
+            try:
+                items = self.iter_dataset(transfer.dataset_id, page_size=1, fields=None, transfer=sample)
+                async with aclosing(items):
+                    async for item in items:
+                        self._record_sample(item)
+                        break
+            except httpx.HTTPError as e:
+                print(f"[ApifyService] Could not sample dataset {transfer.dataset_id}: {e}")
+        self._projected_runs += 1
+
+        if self._sampled_projected_bytes:
+            ratio = self._sampled_full_bytes / self._sampled_projected_bytes
+            transfer.full_bytes = round(transfer.bytes_downloaded * ratio)
+        if sample is not None:
+            # The sample is overhead of the projected run, so it counts against the savings
+            transfer.bytes_downloaded += sample.bytes_downloaded
+
+
+# Process-wide instance: one ApifyClientAsync and one limiter shared by every request
+_shared_service: Optional[ApifyService] = None
+
+
+def get_apify_service() -> ApifyService:
+    """Return the shared ApifyService, creating it on first use."""
+    global _shared_service
+    if _shared_service is None:
+        _shared_service = ApifyService(api_token=os.getenv("APIFY_API_KEY"))
+    return _shared_service
+
+
+async def close_apify_service() -> None:
+    """Abort the shared ApifyService's runs and close its client (call on application shutdown)."""
+    global _shared_service
+    service, _shared_service = _shared_service, None
+    if service is not None:
+        await service.close()
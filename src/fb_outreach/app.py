@@ -1,10 +1,45 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fb_outreach.routes import router
+from fb_outreach.custom_memory_session import memory
+from fb_outreach.memory_storage import RetentionPolicy
+from fb_outreach.http_client import close_http_client
+from fb_outreach.apify_service import get_apify_service, close_apify_service
+from fb_outreach.agent import get_pitch_service, close_pitch_service
 from fastapi.middleware.cors import CORSMiddleware
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background retention / compaction (only when a policy is configured)
+    compaction_task = None
+    policy = RetentionPolicy.from_env()
+    if not policy.is_empty:
+        interval = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "3600"))
+        compaction_task = asyncio.create_task(memory.compact_periodically(policy, interval))
+
+    # One Apify client + actor-run limiter for the whole process
+    if os.getenv("APIFY_API_KEY"):
+        get_apify_service()
+
+    # One LLM client + pitch agent for every pipeline run
+    get_pitch_service()
+
+    yield
+
+    if compaction_task:
+        compaction_task.cancel()
+    await close_apify_service()
+    close_pitch_service()
+    await close_http_client()
+
+
 app = FastAPI(
     title="FB Outreach Pipeline API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -0,0 +1,199 @@
+import dataclasses
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, Set, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BLOB_DIR = os.path.join(BASE_DIR, "memory_blobs")
+
+
+class BlobStore:
+    """
+    Content-addressed, zlib-compressed store for raw API payloads.
+
+    Payloads are keyed by the sha256 of their canonical JSON, so identical
+    Apify/Graph responses are stored once. Records keep a LazyPayload
+    reference instead of the full dict; recently decoded payloads are kept
+    in a small LRU so repeated reads do not decompress again.
+
+    Blobs are shared, so they are not deleted with a record; `sweep` removes
+    the ones no surviving record references (see ShortTermMemory.compact).
+
+    On the event loop use `stage`: it only hashes the payload and keeps it in
+    memory; compression and the file write happen in `write_pending`, which
+    the write-behind flush runs in a worker thread.
+    """
+
+    def __init__(self, root_dir: str = DEFAULT_BLOB_DIR, level: int = 6, cache_size: int = 256):
+        self.root_dir = root_dir
+        self.level = level
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Staged payloads not written yet: digest -> canonical JSON
+        self._pending: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        # Serialises the reuse of an existing blob with sweep's removal
+        self._gc_lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root_dir, digest[:2], f"{digest}.z")
+
+    @staticmethod
+    def _encode(payload: Dict[str, Any]) -> Tuple[str, bytes]:
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest(), encoded
+
+    def _write(self, digest: str, encoded: bytes) -> None:
+        path = self._path(digest)
+        with self._gc_lock:
+            if os.path.exists(path):
+                # A fresh mtime keeps a reused blob out of the next sweep
+                os.utime(path)
+                return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(encoded, self.level))
+        os.replace(tmp_path, path)
+
+    def put(self, payload: Dict[str, Any]) -> "LazyPayload":
+        """Store a payload right away (blocking disk I/O)."""
+        digest, encoded = self._encode(payload)
+        self._write(digest, encoded)
+        return LazyPayload(digest)
+
+    def stage(self, payload: Dict[str, Any]) -> "LazyPayload":
+        """Reference a payload without touching disk; see write_pending."""
+        digest, encoded = self._encode(payload)
+        with self._lock:
+            self._pending.setdefault(digest, encoded)
+        return LazyPayload(digest)
+
+    def write_pending(self) -> None:
+        """Write every staged payload (blocking; call off the event loop)."""
+        with self._lock:
+            pending = list(self._pending.items())
+        for digest, encoded in pending:
+            self._write(digest, encoded)
+            with self._lock:
+                self._pending.pop(digest, None)
+
+    def get(self, digest: str) -> Dict[str, Any]:
+        """Decode a payload, reading the compressed blob through a memory map."""
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+            staged = self._pending.get(digest)
+
+        if staged is not None:
+            value = json.loads(staged)
+        else:
+            with open(self._path(digest), "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    value = json.loads(zlib.decompress(mapped))
+
+        with self._lock:
+            self._cache[digest] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def sweep(self, live_digests: Set[str], min_age_seconds: float) -> Tuple[int, int]:
+        """
+        Delete blobs (and abandoned temp files) not in `live_digests` that were
+        last written more than `min_age_seconds` ago. The grace period covers
+        payloads referenced only from places the caller cannot see: buffered,
+        not yet flushed records and page-cache entries, also in other processes.
+        Returns (blobs removed, bytes reclaimed).
+        """
+        removed = reclaimed = 0
+        cutoff = time.time() - min_age_seconds
+        if not os.path.isdir(self.root_dir):
+            return removed, reclaimed
+        for shard in os.scandir(self.root_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".z"):
+                    digest = entry.name[:-2]
+                    if digest in live_digests:
+                        continue
+                elif not entry.name.endswith(".tmp"):
+                    continue
+                with self._gc_lock:
+                    try:
+                        stat = os.stat(entry.path)
+                        if stat.st_mtime > cutoff:
+                            continue
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                if entry.name.endswith(".z"):
+                    removed += 1
+                    with self._lock:
+                        self._cache.pop(digest, None)
+                reclaimed += stat.st_size
+        return removed, reclaimed
+
+
+def referenced_digests(values: Iterable[Any]) -> Set[str]:
+    """Digests of every LazyPayload reachable from `values` (records, dicts, lists)."""
+    found: Set[str] = set()
+    stack = list(values)
+    while stack:
+        value = stack.pop()
+        if isinstance(value, LazyPayload):
+            found.add(value.digest)
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+            stack.extend(getattr(value, f.name, None) for f in dataclasses.fields(value))
+    return found
+
+
+class LazyPayload(Mapping):
+    """
+    Read-only mapping standing in for a `raw_data` dict.
+
+    Only the digest is held and pickled; the blob is decoded when a key is
+    actually read, so loading records never touches payloads nobody uses.
+    """
+    __slots__ = ("digest",)
+
+    def __init__(self, digest: str):
+        self.digest = digest
+
+    @property
+    def value(self) -> Dict[str, Any]:
+        return blob_store.get(self.digest)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.value[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.value)
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __repr__(self) -> str:
+        return repr(self.value)
+
+    def __getstate__(self):
+        return self.digest
+
+    def __setstate__(self, digest: str):
+        self.digest = digest
+
+
+blob_store = BlobStore(os.getenv("BLOB_STORE_DIR", DEFAULT_BLOB_DIR))
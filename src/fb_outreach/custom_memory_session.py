@@ -5,61 +5,122 @@ import os
 from datetime import datetime
 from dataclasses import dataclass, field
 from typing import Any, List, Optional, Dict
-from fb_outreach.schemas import ApifyFacebookPageData, FacebookAdsResponse, FacebookAdData, FacebookAdsPaging
+from fb_outreach.schemas import (
+    AdsQueryWatermark,
+    ApifyFacebookPageData,
+    FacebookAdsResponse,
+    FacebookAdData,
+    FacebookAdsPaging,
+    SlottedRecord,
+)
+from fb_outreach.blob_store import blob_store, referenced_digests
+from fb_outreach.page_cache import page_cache
+from fb_outreach.memory_storage import (
+    BufferItem,
+    CompactionReport,
+    RetentionPolicy,
+    StorageBackend,
+    create_backend_from_env,
+)
+
+# Unreferenced blobs younger than this survive compaction: their record may
+# still sit in a PipelineContext buffer. Never less than the page-cache TTL,
+# whose entries point at blobs no stored record may reference.
+BLOB_GC_MIN_AGE_SECONDS = float(os.getenv("BLOB_GC_MIN_AGE_SECONDS", "86400"))
 
 # -------------------------------------------------------------------------
 # Custom Memory Implementation (Provided by User)
 # -------------------------------------------------------------------------
-@dataclass
-class BufferItem:
-    data: Any
-    user_id: str
-    run_id: str
-    timestamp: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-
 @dataclass
 class ShortTermMemory:
-    buffer: List[BufferItem] = field(default_factory=list)
-    # storage_file: str = "memory_store.pkl"
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    storage_file = os.path.join(base_dir, "memory_store.pkl")
+    """
+    Record store used by the pipeline and routes.
 
-    def __post_init__(self):
-        self._load_from_disk()
+    Storage is delegated to a pluggable StorageBackend (append-only log or
+    SQLite, see memory_storage.py); callers only use add_memory/get_memory.
+    """
+    backend: Optional[StorageBackend] = None
 
-    def _load_from_disk(self):
-        if os.path.exists(self.storage_file):
-            try:
-                import pickle
-                with open(self.storage_file, "rb") as f:
-                    self.buffer = pickle.load(f)
-                # print(f"Loaded {len(self.buffer)} items from {self.storage_file}")
-            except Exception as e:
-                print(f"Failed to load memory: {e}")
+    def __post_init__(self):
+        if self.backend is None:
+            self.backend = create_backend_from_env()
 
-    def _save_to_disk(self):
-        try:
-            import pickle
-            with open(self.storage_file, "wb") as f:
-                pickle.dump(self.buffer, f)
-            # print(f"Saved {len(self.buffer)} items to {self.storage_file}")
-        except Exception as e:
-            print(f"Failed to save memory: {e}")
+    @property
+    def buffer(self) -> List[BufferItem]:
+        """All stored records (prefer get_memory for scoped lookups)."""
+        return self.backend.items()
 
     def add_memory(self, data: Any, *, user_id: str, run_id: str) -> None:
         item = BufferItem(data=data, user_id=user_id, run_id=run_id)
-        self.buffer.append(item)
-        self._save_to_disk()
-
-    def get_memory(self, user_id: str) -> List[BufferItem]:
-        """Return all BufferItems for the given user_id."""
-        # Reload to ensure we have latest data from other processes if needed
-        self._load_from_disk()
-        return [item for item in self.buffer if item.user_id == user_id]
-
-    def persist(self):
-        """Force save to disk (useful when modifying mutable objects in place)."""
-        self._save_to_disk()
+        self.backend.append(item)
+
+    def add_many(self, items: List[BufferItem]) -> None:
+        """Store pre-built BufferItems in a single backend write."""
+        if items:
+            # Payloads staged by save_ad/save_page land before the records citing them
+            blob_store.write_pending()
+            self.backend.append_many(items)
+
+    def get_memory(self, user_id: str, data_type: Optional[type] = None) -> List[BufferItem]:
+        """Return all BufferItems for the given user_id, optionally of one data type."""
+        return self.backend.query(user_id=user_id, data_type=data_type)
+
+    def get_run(self, run_id: str, data_type: Optional[type] = None) -> List[BufferItem]:
+        """Return all BufferItems recorded under the given run_id (pipeline session)."""
+        return self.backend.query(run_id=run_id, data_type=data_type)
+
+    def get_user_by_email(self, email: str) -> Optional[BufferItem]:
+        """O(1) account lookup for signup/login (user directory, not a buffer scan)."""
+        return self.backend.find_user_by_email(email)
+
+    def get_user(self, user_id: str) -> Optional[BufferItem]:
+        """O(1) account lookup for authenticated requests."""
+        return self.backend.find_user(user_id)
+
+    def get_watermark(self, user_id: str, query_key: str) -> Optional[AdsQueryWatermark]:
+        """Merge every watermark delta stored for one user's saved search."""
+        merged: Optional[AdsQueryWatermark] = None
+        for item in self.backend.query(user_id=user_id, data_type=AdsQueryWatermark):
+            delta = item.data
+            if delta.query_key != query_key:
+                continue
+            if merged is None:
+                merged = AdsQueryWatermark(query_key=query_key)
+            merged.ad_ids.extend(delta.ad_ids)
+            if delta.last_delivery_date and (
+                merged.last_delivery_date is None or delta.last_delivery_date > merged.last_delivery_date
+            ):
+                merged.last_delivery_date = delta.last_delivery_date
+        return merged
+
+    def persist(self, items: Optional[List[BufferItem]] = None):
+        """Write back records modified in place (e.g. session status); all of them when `items` is None."""
+        self.backend.persist(items)
+
+    def compact(self, policy: RetentionPolicy) -> CompactionReport:
+        """
+        Evict records outside the retention policy (TTL / per-user caps), then
+        delete the raw-payload blobs no surviving record references.
+        """
+        report = self.backend.compact(policy)
+        live = referenced_digests(item.data for item in self.backend.items())
+        report.add_blobs(*blob_store.sweep(live, max(BLOB_GC_MIN_AGE_SECONDS, page_cache.ttl_seconds)))
+        return report
+
+    async def compact_periodically(self, policy: RetentionPolicy, interval_seconds: float = 3600):
+        """Background task: run compaction off the event loop every `interval_seconds`."""
+        while True:
+            try:
+                report = await asyncio.to_thread(self.compact, policy)
+                if report.records_removed or report.blobs_removed:
+                    print(
+                        f"Memory compaction removed {report.records_removed} records and "
+                        f"{report.blobs_removed} blobs, reclaimed {report.bytes_reclaimed} bytes "
+                        f"({report.removed_by_partition})"
+                    )
+            except Exception as e:
+                print(f"Memory compaction failed: {e}")
+            await asyncio.sleep(interval_seconds)
 
 # Global instance   
 memory = ShortTermMemory()
@@ -74,6 +135,12 @@ class PipelineStatus(str, enum.Enum):
     FAILED = "failed"
     SKIPPED = "skipped"
 
+class Durability(str, enum.Enum):
+    """When PipelineContext hands buffered records to the store."""
+    PER_EVENT = "event"      # every record is written before the call returns
+    PER_BATCH = "batch"      # written once batch_size records or flush_interval seconds accumulate
+    PER_SESSION = "session"  # written once, when the session closes
+
 class LogLevel(str, enum.Enum):
     INFO = "INFO"
     WARNING = "WARNING"
@@ -83,8 +150,8 @@ class LogLevel(str, enum.Enum):
 # -------------------------------------------------------------------------
 # Data Models (In-Memory Dataclasses)
 # -------------------------------------------------------------------------
-@dataclass
-class PipelineSessionModel:
+@dataclass(slots=True)
+class PipelineSessionModel(SlottedRecord):
     """Tracks a single execution run of the pipeline."""
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
     status: str = PipelineStatus.STARTED
@@ -96,8 +163,8 @@ class PipelineSessionModel:
     skipped_count: int = 0
     error_details: Optional[str] = None
 
-@dataclass
-class FacebookAdModel:
+@dataclass(slots=True)
+class FacebookAdModel(SlottedRecord):
     """Stores raw ad data."""
     session_id: str
     ad_id: Optional[str] = None
@@ -105,8 +172,8 @@ class FacebookAdModel:
     raw_data: Optional[Dict] = None
     created_at: datetime = field(default_factory=datetime.utcnow)
 
-@dataclass
-class FacebookPageModel:
+@dataclass(slots=True)
+class FacebookPageModel(SlottedRecord):
     """Stores detailed page info scraped via Apify."""
     session_id: str
     page_id: str
@@ -117,8 +184,8 @@ class FacebookPageModel:
     raw_data: Optional[Dict] = None
     created_at: datetime = field(default_factory=datetime.utcnow)
 
-@dataclass
-class PitchModel:
+@dataclass(slots=True)
+class PitchModel(SlottedRecord):
     """Stores the generated pitch for a specific page."""
     session_id: str
     page_id: str
@@ -127,8 +194,8 @@ class PitchModel:
     status: str = "generated"
     created_at: datetime = field(default_factory=datetime.utcnow)
 
-@dataclass
-class PipelineLogModel:
+@dataclass(slots=True)
+class PipelineLogModel(SlottedRecord):
     """Structured logs for every step in the pipeline."""
     session_id: str
     step_name: str
@@ -145,13 +212,35 @@ class PipelineContext:
     """
     Manages the lifecycle of a pipeline execution (Session)
     and provides methods to log progress and save data using ShortTermMemory.
+
+    Records are buffered (write-behind) and handed to the store off the event
+    loop, grouped according to `durability`. `flush()` forces pending records
+    out; `__aexit__` always does.
     """
     DEFAULT_USER_ID = "default_user"
 
-    def __init__(self, user_id: str = DEFAULT_USER_ID):
+    def __init__(
+        self,
+        user_id: str = DEFAULT_USER_ID,
+        durability: Optional[Durability] = None,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+    ):
         self.session_id: str = str(uuid.uuid4())
         self.user_id: str = user_id
+        self.durability = Durability(durability or os.getenv("MEMORY_DURABILITY", Durability.PER_BATCH))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
         self._session_model: Optional[PipelineSessionModel] = None
+        self._session_item: Optional[BufferItem] = None
+        self._pending: List[BufferItem] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.Task] = None
+        # Incremental fetching (see load_watermark)
+        self._watermark_key: Optional[str] = None
+        self._known_ad_ids: set = set()
+        self._new_ad_ids: List[str] = []
+        self._newest_delivery_date: Optional[str] = None
 
     async def __aenter__(self):
         # Create the session model
@@ -163,11 +252,7 @@ class PipelineContext:
         
         # Add session object to memory
         # Note: Since it's in-memory, we can mutate this object later and it stays updated in the reference held by BufferItem
-        memory.add_memory(
-            data=self._session_model,
-            user_id=self.user_id,
-            run_id=self.session_id
-        )
+        self._session_item = await self._record(self._session_model)
         
         # Log start
         await self.log_step("pipeline_init", "started", "Pipeline session started")
@@ -192,8 +277,42 @@ class PipelineContext:
             if error_msg:
                 self._session_model.error_details = error_msg
         
-        # PERSIST CHANGES TO DISK
-        memory.persist()
+        # PERSIST CHANGES TO DISK (only this context's session)
+        await self.flush()
+        if self._session_item is not None:
+            await asyncio.to_thread(memory.persist, [self._session_item])
+
+    # --- Write-behind buffer ---
+
+    async def _record(self, data: Any) -> BufferItem:
+        """Buffer a record and flush according to the durability mode."""
+        item = BufferItem(data=data, user_id=self.user_id, run_id=self.session_id)
+        self._pending.append(item)
+
+        if self.durability == Durability.PER_EVENT or (
+            self.durability == Durability.PER_BATCH and len(self._pending) >= self.batch_size
+        ):
+            await self.flush()
+        elif self.durability == Durability.PER_BATCH and self._flush_timer is None:
+            self._flush_timer = asyncio.create_task(self._flush_after_interval())
+        return item
+
+    async def _flush_after_interval(self):
+        await asyncio.sleep(self.flush_interval)
+        self._flush_timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Write all buffered records to memory in one batch, off the event loop."""
+        if self._flush_timer is not None and self._flush_timer is not asyncio.current_task():
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            await asyncio.to_thread(memory.add_many, batch)
 
     # --- Logging Methods ---
 
@@ -209,20 +328,56 @@ class PipelineContext:
             details=details
         )
         
-        memory.add_memory(
-            data=log_entry,
-            user_id=self.user_id,
-            run_id=self.session_id
-        )
+        await self._record(log_entry)
 
     # --- Data Saving Methods ---
-    async def save_ad(self, ad_data: Dict):
-        
-        # print(f"ad_data_type: {type(ad_data)} ad_data: {ad_data}")
-        # ads_data = ad_data.get("data", [{}])
-        # print(f"ads_data_type before for loop: {type(ad_data)} :::: ads_data: {ad_data}")
-        # for data in ad_data:
-        # print(f"data_type in for loop: {type(data)} data: {data}")
+    async def load_watermark(self, query_key: str) -> Optional[AdsQueryWatermark]:
+        """
+        Switch save_ad to incremental mode for one saved search: ads already
+        stored by earlier runs of `query_key` are skipped from now on.
+        """
+        watermark = await asyncio.to_thread(memory.get_watermark, self.user_id, query_key)
+        self._watermark_key = query_key
+        self._known_ad_ids = set(watermark.ad_ids) if watermark else set()
+        self._new_ad_ids = []
+        self._newest_delivery_date = None
+        return watermark
+
+    async def save_watermark(self, exhausted: bool):
+        """
+        Record the ad ids this run added to the search's watermark.
+        The delivery date only advances when the search was read to the end
+        (`exhausted`); otherwise older, never-fetched ads would be skipped forever.
+        """
+        if self._watermark_key is None:
+            return
+        last_delivery_date = self._newest_delivery_date if exhausted else None
+        if not self._new_ad_ids and not last_delivery_date:
+            return
+        await self._record(AdsQueryWatermark(
+            query_key=self._watermark_key,
+            last_delivery_date=last_delivery_date,
+            ad_ids=self._new_ad_ids,
+        ))
+        self._new_ad_ids = []
+
+    async def save_ad(self, ad_data: Dict, paging: Optional[FacebookAdsPaging] = None) -> Optional[FacebookAdData]:
+        """
+        Saves one ad; `paging` records the cursor of the page it arrived on.
+        Returns the stored ad, or None (and stores nothing) for an ad the loaded
+        watermark already knows.
+        """
+        if self._watermark_key is not None:
+            ad_id = ad_data.get("id")
+            if ad_id in self._known_ad_ids:
+                return None
+            if ad_id:
+                self._known_ad_ids.add(ad_id)
+                self._new_ad_ids.append(ad_id)
+            delivery_date = (ad_data.get("ad_delivery_start_time") or "")[:10]
+            if delivery_date and (self._newest_delivery_date is None or delivery_date > self._newest_delivery_date):
+                self._newest_delivery_date = delivery_date
+
         ad_record = FacebookAdsResponse(
                 ads = [FacebookAdData(
                         session_id=self.session_id,
@@ -234,22 +389,16 @@ class PipelineContext:
                         link_descriptions=[ad_data.get("ad_creative_link_descriptions")],
                         link_captions=[ad_data.get("ad_creative_link_captions")],
                         ad_snapshot_url=ad_data.get("ad_snapshot_url"),
-                        raw_data=ad_data
+                        raw_data=blob_store.stage(ad_data)
                 )],
-                # paging=FacebookAdsPaging(
-                #     after_cursor=data.get("cursor_after"),
-                #     next_url=data.get("next_url")
-                # )
+                paging=paging,
             ) 
         # print(f"ad_record: {ad_record}")
-        memory.add_memory(
-            data=ad_record,
-            user_id=self.user_id,
-            run_id=self.session_id
-        )
+        await self._record(ad_record)
+        return ad_record.ads[0]
 
-    async def save_page(self, page_data: Any):
-        """Saves scraped page data (accepts single dict or list of dicts)."""
+    async def save_page(self, page_data: Any) -> List[ApifyFacebookPageData]:
+        """Saves scraped page data (accepts single dict or list of dicts); returns the stored pages."""
 
         # Normalize input
         if isinstance(page_data, dict):
@@ -259,6 +408,7 @@ class PipelineContext:
         else:
             raise TypeError(f"Invalid page_data type: {type(page_data)}")
 
+        pages: List[ApifyFacebookPageData] = []
         for item in page_items:
             print(f"item: {item}")
             rating_raw = item.get("rating")
@@ -314,15 +464,16 @@ class PipelineContext:
                 ad_status=item.get("ad_status"),
                 is_business_page_active=ads_data.get("is_business_page_active"),
 
-                raw_data=item
-            )
+                ad_library_page_id=ads_data.get("id"),
 
-            memory.add_memory(
-                data=page,
-                user_id=self.user_id,
-                run_id=self.session_id
+                raw_data=blob_store.stage(item)
             )
 
+            await self._record(page)
+            pages.append(page)
+
+        return pages
+
     async def save_pitch(self, page_id: str, email: str, content: str):
         """Saves the generated pitch."""    
         pitch_record = PitchModel(
@@ -332,11 +483,7 @@ class PipelineContext:
             pitch_content=content,
             status="generated"
         )
-        memory.add_memory(
-            data=pitch_record,
-            user_id=self.user_id,
-            run_id=self.session_id
-        )
+        await self._record(pitch_record)
 
 
 # # --- Test/Verification Block ---
@@ -1,6 +1,11 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from fastapi import Request, HTTPException, status
-from fb_outreach.security import verify_token
-from fb_outreach.custom_memory_session import memory
+from fb_outreach.security import verify_token, verify_manual_token
+from fb_outreach.custom_memory_session import memory, BufferItem
 
 ### -------------------------
 
@@ -49,20 +54,62 @@ def get_current_user_id(request: Request) -> str:
             detail="Invalid or expired token",
         )
 
+class VerifiedTokenCache:
+    """
+    Bounded LRU of already-verified tokens -> (expiry, user record).
+
+    A hit skips signature verification and the user lookup entirely; entries
+    are dropped once their token expires.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[int, BufferItem]]" = OrderedDict()
+        # Sync dependencies run on FastAPI's threadpool
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[BufferItem]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            exp, user_item = entry
+            if exp < int(time.time()):
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user_item
+
+    def put(self, token: str, exp: int, user_item: BufferItem) -> None:
+        with self._lock:
+            self._entries[token] = (exp, user_item)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+verified_tokens = VerifiedTokenCache(max_size=int(os.getenv("TOKEN_CACHE_SIZE", "1024")))
+
+
 def get_authenticated_user(request: Request):
     token = request.cookies.get("access_token")
-    print("token:", token)
 
     if not token:
         raise HTTPException(status_code=401, detail="Login required")
 
-    user_id = verify_token(token)
+    user_item = verified_tokens.get(token)
+    if user_item:
+        return user_item
 
-    for user_item in memory.buffer:
-        print(f"user_item: {user_item}")
-        if user_item.user_id == user_id:
-            print(f"user_item found: {user_item}")
-            return user_item
+    try:
+        payload = verify_manual_token(token)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    user_item = memory.get_user(payload.get("user_id"))
+    if user_item:
+        verified_tokens.put(token, payload["exp"], user_item)
+        return user_item
 
     raise HTTPException(status_code=401, detail="User not found")
 
@@ -1,9 +1,18 @@
+import asyncio
+import json
 import os
-import requests
-from typing import Optional, Dict, Any, List
+import random
+import re
+import httpx
+from fastapi import HTTPException
+from datetime import date
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple, Hashable
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from pydantic import BaseModel, Field
-from fb_outreach.schemas import AdsRequest, AdsResponse, Paging
-from time import sleep
+from fb_outreach.schemas import AdsRequest, AdsResponse, Paging, FacebookAdsPaging, AdsQueryWatermark
+from fb_outreach.http_client import get_http_client, DEFAULT_TIMEOUT
+from fb_outreach.ads_cache import AdsResponseCache, ads_cache
+from fb_outreach.graph_pacer import GraphApiPacer, graph_pacer
 import logging
 
 
@@ -11,20 +20,103 @@ import logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 logger = logging.getLogger(__name__)
 
+
+class AdsFetchError(RuntimeError):
+    """An ads_archive page still failed after all retries."""
+
+
+def _strip_access_token(url: Optional[str]) -> Optional[str]:
+    """Drop access_token from a paging URL so it can be stored safely."""
+    if not url:
+        return None
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "access_token"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _redact_access_token(message: str) -> str:
+    """Mask access_token values in a log message (httpx errors quote the request URL)."""
+    return re.sub(r"(access_token=)[^&\s'\"]+", r"\1***", message)
+
+
+def normalize_values(value: Any) -> List[str]:
+    """Flatten a search_terms / ad_reached_countries value (str, list of str or {"value": ...} dicts)."""
+    if isinstance(value, list):
+        return [item["value"] if isinstance(item, dict) else item for item in value]
+    if isinstance(value, str):
+        return [value]
+    return []
+
+
+def cache_key(req: AdsRequest, *extra: Hashable) -> Tuple:
+    """
+    Canonical key for an ads_archive query.
+
+    Terms and countries are de-duplicated and sorted, so ["shoes", "Bags"] and
+    ["bags", "shoes"] share an entry. user_id and access_token are left out on
+    purpose: the Graph API answer does not depend on who asked.
+    """
+    terms = sorted({str(term).strip().casefold() for term in normalize_values(req.search_terms)})
+    countries = sorted({str(c).strip().upper() for c in normalize_values(req.ad_reached_countries)})
+    return (
+        tuple(terms),
+        tuple(countries),
+        req.since.isoformat() if req.since else None,
+        req.until.isoformat() if req.until else None,
+        req.limit,
+        *extra,
+    )
+
+def watermark_key(req: AdsRequest) -> str:
+    """
+    Identity of a saved search for incremental fetching: the normalized terms,
+    countries and `since`. A run that read its window to the end covered
+    everything from `since` up to the watermark date, so later runs with the
+    same start only need what came after it; `until` and limit may change.
+    A different `since` is a different search: its window was never read.
+    """
+    terms, countries, since = cache_key(req)[:3]
+    return json.dumps({"search_terms": terms, "ad_reached_countries": countries, "since": since}, sort_keys=True)
+
+
+def drop_known_ads(ads: List[Dict[str, Any]], watermark: Optional[AdsQueryWatermark]) -> List[Dict[str, Any]]:
+    """Ads whose id is not in the watermark yet."""
+    if not watermark or not watermark.ad_ids:
+        return ads
+    known = set(watermark.ad_ids)
+    return [ad for ad in ads if ad.get("id") not in known]
+
 # -------------------- Facebook Ads Service --------------------
 class FacebookAdsService:
     FB_API_BASE = "https://graph.facebook.com/v23.0/ads_archive"
+    FIELDS = [
+        "id",
+        "ad_creative_bodies",
+        "ad_creative_link_titles",
+        "ad_creative_link_descriptions",
+        "ad_creative_link_captions",
+        "ad_snapshot_url",
+        "page_id",
+        "page_name",
+        "ad_delivery_start_time",
+    ]
 
-    def __init__(self, access_token: Optional[str] = None):
+    def __init__(
+        self,
+        access_token: Optional[str] = None,
+        cache: Optional[AdsResponseCache] = None,
+        pacer: Optional[GraphApiPacer] = None,
+    ):
         self.access_token = access_token
+        self.cache = cache if cache is not None else ads_cache
+        self.pacer = pacer if pacer is not None else graph_pacer
         if not self.access_token:
             raise RuntimeError("Facebook access token is missing")
 
-    def fetch_ads(self, req: AdsRequest, retries: int = 3, backoff: int = 2) -> Optional[Dict[str, Any]]:
+    def build_params(self, req: AdsRequest) -> Dict[str, Any]:
+        """
+        Translate an AdsRequest into ads_archive query parameters.
         """
-        Fetch ads from Facebook Ads Archive API.
-        - Retries `retries` times on network errors with exponential backoff.
-        """ 
 
         # Check if search_terms and ad_reached_countries are present
         if not req.search_terms or not req.ad_reached_countries:
@@ -36,31 +128,13 @@ class FacebookAdsService:
         print(f"req.search_terms: {req.search_terms}")
         
         # --------------------search_terms --------------------
-        if isinstance(req.search_terms, list):
-            # list of dicts or list of strings
-            search_terms_list = [
-                item["value"] if isinstance(item, dict) else item
-                for item in req.search_terms
-            ]
-        elif isinstance(req.search_terms, str):
-            # single string
-            search_terms_list = [req.search_terms]
-        else:
-            search_terms_list = []
+        search_terms_list = normalize_values(req.search_terms)
 
         print(f"search_terms_list: {search_terms_list}")
 
         print(f"req.ad_reached_countries: {req.ad_reached_countries}")        
         # -------------------- ad_reached_countries --------------------
-        if isinstance(req.ad_reached_countries, list):
-            countries_list = [
-                item["value"] if isinstance(item, dict) else item
-                for item in req.ad_reached_countries
-            ]
-        elif isinstance(req.ad_reached_countries, str):
-            countries_list = [req.ad_reached_countries]
-        else:
-            countries_list = []
+        countries_list = normalize_values(req.ad_reached_countries)
 
         print(f"countries_list: {countries_list}")
 
@@ -68,16 +142,7 @@ class FacebookAdsService:
             "search_terms": search_terms_list,
             "ad_active_status": "ACTIVE",
             "ad_reached_countries": countries_list,
-            "fields": ",".join([
-                "id",
-                "ad_creative_bodies",
-                "ad_creative_link_titles",
-                "ad_creative_link_descriptions",
-                "ad_creative_link_captions",
-                "ad_snapshot_url",
-                "page_id",
-                "page_name"
-            ]),
+            "fields": ",".join(self.FIELDS),
             "access_token": self.access_token,
             "limit": req.limit
         }
@@ -86,22 +151,174 @@ class FacebookAdsService:
         print(f"req.until: {req.until}")
        
         if req.since:
-            params["ad_delivery_date_min"] = req.since
+            params["ad_delivery_date_min"] = str(req.since)
         if req.until:
-            params["ad_delivery_date_max"] = req.until
+            params["ad_delivery_date_max"] = str(req.until)
+
+        return params
 
+    def since_watermark(self, req: AdsRequest, watermark: Optional[AdsQueryWatermark]) -> Optional[AdsRequest]:
+        """
+        Narrow `req` to ads delivered on or after the watermark date.
+        Returns None when that leaves an empty window, i.e. an earlier run of
+        the same search (same `since`, see watermark_key) already read all of it.
+        """
+        if not watermark or not watermark.last_delivery_date:
+            return req
+        since = date.fromisoformat(watermark.last_delivery_date)
+        if req.since and req.since >= since:
+            return req
+        if req.until and since > req.until:
+            return None
+        return req.model_copy(update={"since": since})
+
+    async def _get_page(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: Optional[Dict[str, Any]],
+        retries: int,
+        backoff: int,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        GET one ads_archive page, retrying `retries` times with jittered exponential backoff.
+        Every attempt goes through the pacer; a throttling pause replaces the backoff sleep.
+        """
         attempt = 0
         while attempt < retries:
             try:
-                response = requests.get(self.FB_API_BASE, params=params, timeout=10)
+                await self.pacer.wait()
+                response = await client.get(url, params=params, timeout=10)
+                self.pacer.observe(response)
                 response.raise_for_status()
-                data = response.json()
-                logger.info(f"Fetched {len(data.get('data', []))} ads for search_terms={req.search_terms}")
-                return data
-            except requests.exceptions.RequestException as e:
+                return response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                # ValueError: a 200 whose body is not JSON (e.g. a proxy's HTML error page)
                 attempt += 1
-                logger.warning(f"Attempt {attempt}/{retries} failed: {e}")
-                sleep(backoff ** attempt)  # exponential backoff
+                logger.warning(f"Attempt {attempt}/{retries} failed: {_redact_access_token(str(e))}")
+                if attempt < retries and not self.pacer.paused:
+                    # full jitter keeps concurrent retries from hitting the API in lockstep
+                    await asyncio.sleep(random.uniform(0, backoff ** attempt))
 
         logger.error(f"Failed to fetch ads after {retries} attempts")
-        return None
\ No newline at end of file
+        return None
+
+    async def fetch_ads_async(
+        self,
+        req: AdsRequest,
+        retries: int = 3,
+        backoff: int = 2,
+        client: Optional[httpx.AsyncClient] = None,
+        watermark: Optional[AdsQueryWatermark] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch ads from Facebook Ads Archive API without blocking the event loop.
+        - Uses the shared keep-alive pool unless a client is passed in.
+        - Retries `retries` times on network/HTTP errors with jittered exponential backoff.
+        - Successful responses are served from self.cache until they expire.
+        - With a `watermark`, only ads newer than it are requested and returned.
+        """
+        if watermark is not None:
+            req = self.since_watermark(req, watermark)
+            if req is None:
+                return {"data": []}
+            data = await self.fetch_ads_async(req, retries=retries, backoff=backoff, client=client)
+            if data is None:
+                return None
+            # The cache holds the unfiltered answer; filter a copy per caller
+            return {**data, "data": drop_known_ads(data.get("data", []), watermark)}
+
+        key = cache_key(req)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Cache hit for search_terms={req.search_terms}")
+            return cached
+
+        params = self.build_params(req)
+        client = client or get_http_client()
+
+        data = await self._get_page(client, self.FB_API_BASE, params, retries, backoff)
+        if data is not None:
+            logger.info(f"Fetched {len(data.get('data', []))} ads for search_terms={req.search_terms}")
+            self.cache.put(key, data)
+        return data
+
+    async def iter_ad_pages(
+        self,
+        req: AdsRequest,
+        max_ads: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        retries: int = 3,
+        backoff: int = 2,
+        client: Optional[httpx.AsyncClient] = None,
+        watermark: Optional[AdsQueryWatermark] = None,
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], FacebookAdsPaging]]:
+        """
+        Follow ads_archive `paging.next` cursors, yielding (ads, paging) as each page arrives.
+        - Stops once `max_ads` ads or `max_pages` pages have been yielded (None = no limit).
+        - A page that still fails after retries raises AdsFetchError; earlier pages stay yielded.
+        - With a `watermark`, only ads newer than it are requested and yielded (and counted).
+        """
+        if watermark is not None:
+            req = self.since_watermark(req, watermark)
+            if req is None:
+                return
+        client = client or get_http_client()
+        url: Optional[str] = self.FB_API_BASE
+        params: Optional[Dict[str, Any]] = self.build_params(req)
+        ads_seen = 0
+        pages_seen = 0
+
+        while url:
+            if max_pages is not None and pages_seen >= max_pages:
+                break
+            if max_ads is not None and ads_seen >= max_ads:
+                break
+
+            data = await self._get_page(client, url, params, retries, backoff)
+            if data is None:
+                raise AdsFetchError(f"ads_archive page {pages_seen + 1} failed after {retries} attempts")
+
+            ads = drop_known_ads(data.get("data", []), watermark)
+            if max_ads is not None:
+                ads = ads[: max_ads - ads_seen]
+            pages_seen += 1
+            ads_seen += len(ads)
+
+            raw_paging = data.get("paging") or {}
+            # The next URL already carries every query parameter, token included
+            url = raw_paging.get("next")
+            params = None
+            paging = FacebookAdsPaging(
+                after_cursor=(raw_paging.get("cursors") or {}).get("after"),
+                next_url=_strip_access_token(url),
+            )
+
+            logger.info(f"Fetched page {pages_seen} with {len(ads)} ads (total {ads_seen})")
+            if ads:
+                yield ads, paging
+
+    async def iter_ads(
+        self,
+        req: AdsRequest,
+        max_ads: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream individual ads across cursor pages; see iter_ad_pages for the budgets.
+        """
+        async for ads, _ in self.iter_ad_pages(req, max_ads=max_ads, max_pages=max_pages, **kwargs):
+            for ad in ads:
+                yield ad
+
+    def fetch_ads(self, req: AdsRequest, retries: int = 3, backoff: int = 2) -> Optional[Dict[str, Any]]:
+        """
+        Blocking compatibility wrapper around fetch_ads_async.
+        Only for sync callers: async code must await fetch_ads_async instead.
+        """
+        async def _run():
+            async with httpx.AsyncClient(timeout=DEFAULT_TIMEOUT) as client:
+                return await self.fetch_ads_async(req, retries=retries, backoff=backoff, client=client)
+
+        return asyncio.run(_run())
@@ -0,0 +1,189 @@
+import asyncio
+import email.utils
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+# Graph API error codes that mean "rate limited" (app, user, page, ad account, BUC)
+THROTTLE_ERROR_CODES = {4, 17, 32, 613, 80000, 80003, 80004, 80014}
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _parse_json_header(value: Optional[str]) -> Any:
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+class GraphApiPacer:
+    """
+    Paces outgoing Graph API calls from the usage headers of earlier responses.
+
+    Every response reports how much of the rate-limit window is used
+    (`x-app-usage`, `x-business-use-case-usage`, as percentages). Below
+    `slow_at` calls go out unthrottled. Between `slow_at` and `pause_at` calls
+    are spaced out, linearly up to `max_spacing` seconds apart. At `pause_at`
+    or above, or on `Retry-After` / a throttling error, all calls wait until
+    the pause ends.
+
+    Slots are handed out under a thread lock instead of an asyncio lock, so one
+    pacer can be shared by every event loop in the process.
+    """
+
+    # Graph rate-limit windows are at most one hour long
+    MAX_PAUSE_SECONDS = 3600.0
+
+    def __init__(
+        self,
+        slow_at: float = 75.0,
+        pause_at: float = 95.0,
+        max_spacing: float = 5.0,
+        pause_seconds: float = 60.0,
+    ):
+        self.slow_at = slow_at
+        self.pause_at = pause_at
+        self.max_spacing = max_spacing
+        self.pause_seconds = pause_seconds
+
+        self.usage_pct = 0.0
+        self._resume_at = 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.delayed_calls = 0
+        self.total_delay = 0.0
+        self.pauses = 0
+
+    # -------------------- before a call --------------------
+    def _spacing(self) -> float:
+        if self.usage_pct < self.slow_at:
+            return 0.0
+        span = max(self.pause_at - self.slow_at, 1e-9)
+        return self.max_spacing * min(1.0, (self.usage_pct - self.slow_at) / span)
+
+    def reserve(self) -> float:
+        """Claim the next call slot and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._resume_at, self._next_slot)
+            self._next_slot = slot + self._spacing()
+            delay = slot - now
+            self.calls += 1
+            if delay > 0:
+                self.delayed_calls += 1
+                self.total_delay += delay
+            return delay
+
+    async def wait(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def paused(self) -> bool:
+        return self._resume_at > time.monotonic()
+
+    # -------------------- after a call --------------------
+    def pause_for(self, seconds: float, reason: str) -> None:
+        seconds = min(seconds, self.MAX_PAUSE_SECONDS)
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+            if resume_at > self._resume_at:
+                self._resume_at = resume_at
+                self.pauses += 1
+                logger.warning(f"Pausing Graph API calls for {seconds:.1f}s ({reason})")
+
+    def observe(self, response: httpx.Response) -> None:
+        """Update usage and pauses from one Graph API response."""
+        headers = response.headers
+        usage = 0.0
+        regain_minutes = 0.0
+
+        app_usage = _parse_json_header(headers.get("x-app-usage"))
+        if isinstance(app_usage, dict):
+            usage = max([usage] + [float(v) for v in app_usage.values() if isinstance(v, (int, float))])
+
+        buc_usage = _parse_json_header(headers.get("x-business-use-case-usage"))
+        if isinstance(buc_usage, dict):
+            for entries in buc_usage.values():
+                for entry in entries if isinstance(entries, list) else []:
+                    # Malformed entries only lose their pacing, never the request
+                    if not isinstance(entry, dict):
+                        continue
+                    for name in ("call_count", "total_cputime", "total_time"):
+                        value = entry.get(name)
+                        if isinstance(value, (int, float)):
+                            usage = max(usage, float(value))
+                    regain = entry.get("estimated_time_to_regain_access")
+                    if isinstance(regain, (int, float)):
+                        regain_minutes = max(regain_minutes, float(regain))
+
+        if app_usage is not None or buc_usage is not None:
+            # Error responses often carry no usage headers; keep the last reading
+            with self._lock:
+                self.usage_pct = usage
+
+        retry_after = _parse_retry_after(headers.get("retry-after"))
+        if retry_after:
+            self.pause_for(retry_after, "Retry-After")
+        elif regain_minutes:
+            self.pause_for(regain_minutes * 60, "estimated_time_to_regain_access")
+        elif usage >= self.pause_at:
+            self.pause_for(self.pause_seconds, f"usage at {usage:.0f}%")
+        elif response.status_code >= 400 and self._is_throttle_error(response):
+            self.pause_for(self.pause_seconds, "throttling error")
+
+    @staticmethod
+    def _is_throttle_error(response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        try:
+            code = response.json().get("error", {}).get("code")
+        except (ValueError, AttributeError):
+            return False
+        return code in THROTTLE_ERROR_CODES
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "usage_pct": self.usage_pct,
+                "paused_for": round(max(0.0, self._resume_at - time.monotonic()), 2),
+                "calls": self.calls,
+                "delayed_calls": self.delayed_calls,
+                "total_delay_seconds": round(self.total_delay, 2),
+                "pauses": self.pauses,
+            }
+
+
+graph_pacer = GraphApiPacer(
+    slow_at=float(os.getenv("GRAPH_USAGE_SLOW_AT", "75")),
+    pause_at=float(os.getenv("GRAPH_USAGE_PAUSE_AT", "95")),
+    max_spacing=float(os.getenv("GRAPH_MAX_SPACING_SECONDS", "5")),
+    pause_seconds=float(os.getenv("GRAPH_PAUSE_SECONDS", "60")),
+)
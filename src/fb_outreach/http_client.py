@@ -0,0 +1,33 @@
+import asyncio
+import logging
+import weakref
+from typing import Optional
+
+import httpx
+
+# Keep-alive pool shared by every outbound API call (Graph API, Apify)
+DEFAULT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30)
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# httpx logs every request URL at INFO, which would include access tokens
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# One client per event loop: httpx connections cannot be shared across loops
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client: Optional[httpx.AsyncClient] = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=DEFAULT_LIMITS, timeout=DEFAULT_TIMEOUT)
+        _clients[loop] = client
+    return client
+
+
+async def close_http_client() -> None:
+    """Close the running loop's pooled client (call on application shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,1066 @@
+import heapq
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fb_outreach.schemas import SlottedRecord
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+# -------------------------------------------------------------------------
+# Stored record
+# -------------------------------------------------------------------------
+@dataclass(slots=True)
+class BufferItem(SlottedRecord):
+    data: Any
+    user_id: str
+    run_id: str
+    timestamp: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+# -------------------------------------------------------------------------
+# Retention
+# -------------------------------------------------------------------------
+@dataclass
+class RetentionPolicy:
+    """
+    What compaction removes.
+
+    ttl_days maps a partition name (e.g. "logs", "pages") to the maximum
+    record age in days; max_records_per_user keeps only the newest N records
+    of each user per partition. User accounts are never evicted, and
+    saved-search watermarks are exempt from the per-user cap.
+    """
+    ttl_days: Dict[str, float] = field(default_factory=dict)
+    max_records_per_user: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """
+        Build a policy from RETENTION_TTL_DAYS ("logs=7,pages=30") and
+        RETENTION_MAX_RECORDS_PER_USER.
+        """
+        ttl_days: Dict[str, float] = {}
+        for entry in os.getenv("RETENTION_TTL_DAYS", "").split(","):
+            if "=" in entry:
+                partition, days = entry.split("=", 1)
+                ttl_days[partition.strip()] = float(days)
+        cap = os.getenv("RETENTION_MAX_RECORDS_PER_USER")
+        return cls(ttl_days=ttl_days, max_records_per_user=int(cap) if cap else None)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.ttl_days and self.max_records_per_user is None
+
+    def cutoff(self, partition: str, now: datetime) -> Optional[str]:
+        """Oldest timestamp kept in `partition`, formatted like BufferItem.timestamp."""
+        if partition not in self.ttl_days:
+            return None
+        return (now - timedelta(days=self.ttl_days[partition])).strftime(TIMESTAMP_FORMAT)
+
+    def record_cap(self, partition: str) -> Optional[int]:
+        """Per-user record cap applied to `partition`, or None."""
+        if partition in UNCAPPED_TABLES:
+            return None
+        return self.max_records_per_user
+
+    def keep(self, partition: str, items: List[BufferItem], now: datetime) -> List[BufferItem]:
+        """Return the records of `partition` that survive this policy (order preserved)."""
+        cutoff = self.cutoff(partition, now)
+        if cutoff is not None:
+            items = [item for item in items if item.timestamp >= cutoff]
+
+        cap = self.record_cap(partition)
+        if cap is not None:
+            seen: Dict[str, int] = {}
+            kept: List[BufferItem] = []
+            for item in reversed(items):
+                seen[item.user_id] = seen.get(item.user_id, 0) + 1
+                if seen[item.user_id] <= cap:
+                    kept.append(item)
+            items = kept[::-1]
+        return items
+
+
+@dataclass
+class CompactionReport:
+    records_removed: int = 0
+    bytes_reclaimed: int = 0
+    removed_by_partition: Dict[str, int] = field(default_factory=dict)
+    blobs_removed: int = 0
+
+    def add(self, partition: str, records: int, reclaimed: int):
+        if records:
+            self.removed_by_partition[partition] = records
+        self.records_removed += records
+        self.bytes_reclaimed += reclaimed
+
+    def add_blobs(self, blobs: int, reclaimed: int):
+        self.blobs_removed += blobs
+        self.bytes_reclaimed += reclaimed
+
+# -------------------------------------------------------------------------
+# Backend interface
+# -------------------------------------------------------------------------
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORAGE_FILE = os.path.join(BASE_DIR, "memory_store.pkl")
+DEFAULT_SQLITE_FILE = os.path.join(BASE_DIR, "memory_store.db")
+
+
+class StorageBackend(ABC):
+    """Persistence engine behind ShortTermMemory."""
+
+    @abstractmethod
+    def append(self, item: BufferItem) -> None:
+        """Durably store a new record."""
+
+    def append_many(self, items: List[BufferItem]) -> None:
+        """Store several records at once (backends override to batch the write)."""
+        for item in items:
+            self.append(item)
+
+    @abstractmethod
+    def query(
+        self,
+        *,
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        data_type: Optional[type] = None,
+    ) -> List[BufferItem]:
+        """
+        Return records matching every given filter, oldest first: insertion
+        order within a partition, partitions interleaved by timestamp.
+        """
+
+    @abstractmethod
+    def items(self) -> List[BufferItem]:
+        """Return every stored record."""
+
+    @abstractmethod
+    def find_user_by_email(self, email: str) -> Optional[BufferItem]:
+        """Return the user account record registered with `email`."""
+
+    @abstractmethod
+    def find_user(self, user_id: str) -> Optional[BufferItem]:
+        """Return the user account record for `user_id`."""
+
+    @abstractmethod
+    def persist(self, items: Optional[List[BufferItem]] = None) -> None:
+        """
+        Write back records that were mutated in place: `items` only (e.g. the
+        session a PipelineContext is closing), or every such record when None.
+        """
+
+    @abstractmethod
+    def compact(self, policy: RetentionPolicy, now: Optional[datetime] = None) -> CompactionReport:
+        """Remove records the policy no longer retains and report what was freed."""
+
+    def close(self) -> None:
+        pass
+
+# -------------------------------------------------------------------------
+# Partitioning
+# -------------------------------------------------------------------------
+# Each record type lives in its own partition (log segment or table), so a
+# read for pages/ads never deserializes pipeline logs. Types are routed by
+# class name, so this module does not need to import the models that live
+# next to ShortTermMemory.
+TABLE_BY_TYPE_NAME = {
+    "PipelineSessionModel": "sessions",
+    "FacebookAdsResponse": "ads",
+    "ApifyFacebookPageData": "pages",
+    "PitchModel": "pitches",
+    "PipelineLogModel": "logs",
+    "AdsQueryWatermark": "watermarks",
+}
+USERS_TABLE = "users"
+FALLBACK_TABLE = "records"
+TABLES = [*TABLE_BY_TYPE_NAME.values(), USERS_TABLE, FALLBACK_TABLE]
+PAGE_KEYED_TABLES = {"ads", "pages", "pitches"}
+# Partitions whose records are mutated in place and written back by persist()
+MUTABLE_TABLES = {"sessions"}
+# Partitions retention never touches
+PROTECTED_TABLES = {USERS_TABLE}
+# Partitions only a TTL evicts from: dropping a watermark delta makes the next
+# incremental fetch download and store ads it already has
+UNCAPPED_TABLES = {"watermarks"}
+
+
+def _is_user_record(data: Any) -> bool:
+    return isinstance(data, dict) and "email" in data and "password" in data
+
+
+def _page_id_of(data: Any) -> Optional[str]:
+    page_id = getattr(data, "page_id", None)
+    if page_id is None and getattr(data, "ads", None):
+        page_id = data.ads[0].page_id
+    return page_id
+
+
+def partition_for(data: Any) -> str:
+    """Partition (table / log segment) a record is stored in."""
+    if _is_user_record(data):
+        return USERS_TABLE
+    return TABLE_BY_TYPE_NAME.get(type(data).__name__, FALLBACK_TABLE)
+
+
+def partitions_for_type(data_type: Optional[type]) -> List[str]:
+    """Partitions that can hold records of `data_type` (all when None)."""
+    if data_type is None:
+        return TABLES
+    if data_type.__name__ in TABLE_BY_TYPE_NAME:
+        return [TABLE_BY_TYPE_NAME[data_type.__name__]]
+    if data_type is dict:
+        return [USERS_TABLE, FALLBACK_TABLE]
+    return [FALLBACK_TABLE]
+
+
+def merge_partitions(groups: List[List[BufferItem]]) -> List[BufferItem]:
+    """Interleave per-partition results (each in insertion order) by timestamp."""
+    groups = [group for group in groups if group]
+    if len(groups) <= 1:
+        return groups[0] if groups else []
+    return list(heapq.merge(*groups, key=lambda item: item.timestamp))
+
+# -------------------------------------------------------------------------
+# Append-only log backend
+# -------------------------------------------------------------------------
+# Log records are framed as a 4-byte big-endian length followed by the pickle
+RECORD_HEADER = struct.Struct(">I")
+
+
+def _iter_frames(data: bytes):
+    """Yield (frame bytes, record or None if unreadable) for complete log frames in `data`."""
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        (length,) = RECORD_HEADER.unpack_from(data, pos)
+        end = pos + RECORD_HEADER.size + length
+        if end > len(data):
+            break
+        try:
+            item = pickle.loads(data[pos + RECORD_HEADER.size:end])
+        except Exception:
+            item = None
+        yield data[pos:end], item
+        pos = end
+
+
+class LogSegment:
+    """
+    Append-only record store for one partition.
+
+    Every `append_many` writes one length-prefixed pickled record to the
+    current log segment, so a write costs O(record) instead of O(store).
+    Once `snapshot_every` records are logged the segment is `rollover_due`:
+    `roll_over` writes the full buffer to `storage_file` outside the caller's
+    lock and starts a fresh log generation. Startup loads the snapshot and
+    replays the tail of its log.
+
+    In a `keyed` segment (records mutated in place, e.g. sessions) there is
+    one record per run_id: `write_back` appends the updated record again and
+    replay lets the last copy win, so an update costs O(record) as well.
+
+    Secondary indexes by user_id, run_id and data type are maintained on
+    insert, so lookups cost O(result) instead of O(store).
+
+    A snapshot that cannot be unpickled (e.g. its classes are not importable
+    yet) is retried on the next access and is never overwritten.
+
+    Several processes may share a segment: reads hold a shared `flock` on
+    `<storage_file>.lock` and appends, snapshots and rollovers an exclusive
+    one. Where fcntl is missing (Windows) the log backend is single-process
+    only; use the sqlite backend there.
+    """
+
+    def __init__(self, storage_file: str, snapshot_every: int = 500, keyed: bool = False):
+        self.storage_file = storage_file
+        self.snapshot_every = snapshot_every
+        self.keyed = keyed
+        self.rollover_due = False
+        self.buffer: List[BufferItem] = []
+        self._generation: int = 0
+        self._log_records: int = 0
+        self._log_offset: int = 0
+        self._own_offsets: Set[int] = set()
+        self._snapshot_signature: Optional[Tuple[int, int, int]] = None
+        self._by_user: Dict[str, List[BufferItem]] = {}
+        self._by_run: Dict[str, List[BufferItem]] = {}
+        self._by_user_type: Dict[Tuple[str, type], List[BufferItem]] = {}
+        self._by_run_type: Dict[Tuple[str, type], List[BufferItem]] = {}
+        # User directory (only populated in the users partition)
+        self._by_email: Dict[str, BufferItem] = {}
+        # Record per run_id (keyed segments only)
+        self._by_key: Dict[str, BufferItem] = {}
+        self.load_error: Optional[Exception] = None
+        self.skipped_records = 0
+        self._lock_fd: Optional[int] = None
+        with self._locked():
+            self._load_from_disk()
+            self._truncate_torn_tail()
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Hold the segment's lock file against other processes."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_fd is None:
+            self._lock_fd = os.open(f"{self.storage_file}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _log_path(self, generation: int) -> str:
+        root, _ = os.path.splitext(self.storage_file)
+        return f"{root}.{generation}.log"
+
+    def _stat_snapshot(self) -> Optional[Tuple[int, int, int]]:
+        """File generation of the snapshot: (inode, size, mtime_ns), or None if absent."""
+        try:
+            st = os.stat(self.storage_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _load_from_disk(self):
+        self.buffer = []
+        self._generation = 0
+        self._log_records = 0
+        self._log_offset = 0
+        self._own_offsets = set()
+        self._snapshot_signature = self._stat_snapshot()
+        self.load_error = None
+        self.skipped_records = 0
+
+        if self._snapshot_signature is not None:
+            try:
+                with open(self.storage_file, "rb") as f:
+                    snapshot = pickle.load(f)
+                # Legacy stores are a bare pickled list (generation 0)
+                if isinstance(snapshot, dict):
+                    self._generation = snapshot.get("generation", 0)
+                    self.buffer = snapshot.get("items", [])
+                else:
+                    self.buffer = snapshot
+            except Exception as e:
+                self.load_error = e
+                print(f"Failed to load memory: {e}")
+
+        self._rebuild_indexes()
+        self._read_log_tail()
+
+    def _refresh(self):
+        """
+        Pull in changes made by other processes sharing the store.
+
+        A new snapshot (different inode/size/mtime) means the store was
+        rewritten, so everything is reloaded; otherwise only log records
+        appended since the last read are deserialized.
+        """
+        if self.load_error is not None or self._stat_snapshot() != self._snapshot_signature:
+            self._load_from_disk()
+        else:
+            self._read_log_tail()
+
+    def _index(self, item: BufferItem):
+        data_type = type(item.data)
+        self._by_user.setdefault(item.user_id, []).append(item)
+        self._by_run.setdefault(item.run_id, []).append(item)
+        self._by_user_type.setdefault((item.user_id, data_type), []).append(item)
+        self._by_run_type.setdefault((item.run_id, data_type), []).append(item)
+        if _is_user_record(item.data):
+            # First registration wins, like the old linear scan
+            self._by_email.setdefault(item.data["email"], item)
+        if self.keyed:
+            self._by_key[item.run_id] = item
+
+    def _add(self, item: BufferItem):
+        """Buffer and index a record; in a keyed segment a repeat updates the first copy."""
+        if self.keyed:
+            existing = self._by_key.get(item.run_id)
+            if existing is not None:
+                existing.data = item.data
+                return
+        self.buffer.append(item)
+        self._index(item)
+
+    def _rebuild_indexes(self):
+        self._by_user = {}
+        self._by_run = {}
+        self._by_user_type = {}
+        self._by_run_type = {}
+        self._by_email = {}
+        self._by_key = {}
+        for item in self.buffer:
+            self._index(item)
+
+    def _read_log_tail(self):
+        """Read records appended to the current log since `_log_offset`."""
+        log_path = self._log_path(self._generation)
+        try:
+            if os.path.getsize(log_path) <= self._log_offset:
+                return
+        except FileNotFoundError:
+            return
+
+        with open(log_path, "rb") as f:
+            f.seek(self._log_offset)
+            while True:
+                start = f.tell()
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                (length,) = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                self._log_offset = f.tell()
+                self._log_records += 1
+
+                # Records this process wrote are already in the buffer
+                if start in self._own_offsets:
+                    self._own_offsets.discard(start)
+                    continue
+                try:
+                    item = pickle.loads(payload)
+                except Exception as e:
+                    self.skipped_records += 1
+                    print(f"Skipping corrupt memory record: {e}")
+                    continue
+                self._add(item)
+
+    def _truncate_torn_tail(self):
+        """Drop a torn trailing record left by a crash so new appends stay aligned."""
+        log_path = self._log_path(self._generation)
+        if os.path.exists(log_path) and self._log_offset < os.path.getsize(log_path):
+            with open(log_path, "r+b") as f:
+                f.truncate(self._log_offset)
+
+    def _append_to_log(self, items: List[BufferItem]) -> bool:
+        """Append records with a single write; offsets are tracked per record."""
+        try:
+            frames = []
+            for item in items:
+                payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+                frames.append(RECORD_HEADER.pack(len(payload)) + payload)
+            with open(self._log_path(self._generation), "ab") as f:
+                start = f.tell()
+                f.write(b"".join(frames))
+                end = f.tell()
+        except Exception as e:
+            print(f"Failed to append memory record: {e}")
+            return False
+
+        if start == self._log_offset:
+            self._log_offset = end
+            self._log_records += len(frames)
+        else:
+            # Another process appended in between; skip our own records when
+            # the tail is read so they are not indexed twice.
+            for frame in frames:
+                self._own_offsets.add(start)
+                start += len(frame)
+
+        if self._log_records >= self.snapshot_every:
+            self.rollover_due = True
+        return True
+
+    def _save_to_disk(self) -> bool:
+        """Write a full snapshot and start a new, empty log generation."""
+        self._refresh()
+        if self.load_error is not None:
+            # The buffer is missing the snapshot's records; writing it would lose them
+            print(f"Not overwriting unreadable memory snapshot {self.storage_file}")
+            return False
+        old_log = self._log_path(self._generation)
+        next_generation = self._generation + 1
+        tmp_file = f"{self.storage_file}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                pickle.dump(
+                    {"generation": next_generation, "items": self.buffer},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            # Clear a log left by a rewrite that crashed before its snapshot landed
+            open(self._log_path(next_generation), "wb").close()
+            os.replace(tmp_file, self.storage_file)
+            # print(f"Saved {len(self.buffer)} items to {self.storage_file}")
+        except Exception as e:
+            print(f"Failed to save memory: {e}")
+            return False
+
+        self._generation = next_generation
+        self.rollover_due = False
+        self._log_records = 0
+        self._log_offset = 0
+        self._own_offsets = set()
+        self._snapshot_signature = self._stat_snapshot()
+        if os.path.exists(old_log):
+            os.remove(old_log)
+        return True
+
+    def append_many(self, items: List[BufferItem]) -> bool:
+        """Add records; returns False if they could not be written to the log."""
+        with self._locked():
+            self._refresh()
+            for item in items:
+                self._add(item)
+            return self._append_to_log(items)
+
+    def write_back(self, items: List[BufferItem]) -> bool:
+        """
+        Log the current state of records mutated in place (keyed segments).
+        Records no longer stored (e.g. compacted away) are not brought back.
+        """
+        with self._locked():
+            self._refresh()
+            items = [item for item in items if item.run_id in self._by_key]
+            for item in items:
+                self._by_key[item.run_id].data = item.data
+            return self._append_to_log(items) if items else True
+
+    def query(
+        self,
+        *,
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        data_type: Optional[type] = None,
+    ) -> List[BufferItem]:
+        # Pick up records written by other processes since the last read
+        with self._locked(exclusive=False):
+            self._refresh()
+        if user_id is not None:
+            if data_type is None:
+                items = self._by_user.get(user_id, [])
+            else:
+                items = self._by_user_type.get((user_id, data_type), [])
+            if run_id is not None:
+                items = [item for item in items if item.run_id == run_id]
+            return list(items)
+        if run_id is not None:
+            if data_type is None:
+                return list(self._by_run.get(run_id, []))
+            return list(self._by_run_type.get((run_id, data_type), []))
+        if data_type is not None:
+            return [item for item in self.buffer if type(item.data) is data_type]
+        return list(self.buffer)
+
+    def items(self) -> List[BufferItem]:
+        with self._locked(exclusive=False):
+            self._refresh()
+        return list(self.buffer)
+
+    def find_by_email(self, email: str) -> Optional[BufferItem]:
+        with self._locked(exclusive=False):
+            self._refresh()
+        return self._by_email.get(email)
+
+    def find_by_user(self, user_id: str) -> Optional[BufferItem]:
+        with self._locked(exclusive=False):
+            self._refresh()
+        items = self._by_user.get(user_id)
+        return items[0] if items else None
+
+    def snapshot(self) -> bool:
+        """Force a snapshot (useful when modifying mutable objects in place)."""
+        with self._locked():
+            return self._save_to_disk()
+
+    def rewrite_mark(self) -> Tuple[int, int, int]:
+        """Where a compaction rewrite starts: (generation, buffered records, log offset)."""
+        with self._locked(exclusive=False):
+            self._refresh()
+        return self._generation, len(self.buffer), self._log_offset
+
+    def write_rewrite(self, items: List[BufferItem], mark: Tuple[int, int, int]) -> Optional[str]:
+        """
+        Write the snapshot replacing the records up to `mark` with `items` to a
+        temp file. Touches no segment state, so it runs without the backend lock.
+        """
+        tmp_file = f"{self.storage_file}.{os.getpid()}.{threading.get_ident()}.rewrite.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                pickle.dump({"generation": mark[0] + 1, "items": items}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"Failed to save memory: {e}")
+            return None
+        return tmp_file
+
+    def finish_rewrite(self, tmp_file: str, items: List[BufferItem], mark: Tuple[int, int, int]) -> bool:
+        """
+        Install a snapshot from write_rewrite. Records appended since `mark`
+        are carried over by copying their log bytes into the new generation's
+        log; in a keyed segment, write-backs of records the rewrite evicted
+        are left out so they do not come back on the next load. If the
+        segment rolled over in the meantime the rewrite is dropped.
+        """
+        with self._locked():
+            generation, records, offset = mark
+            self._refresh()
+            if self.load_error is not None or self._generation != generation:
+                os.remove(tmp_file)
+                return False
+
+            old_log = self._log_path(generation)
+            appended_since = self.buffer[records:]
+            tail = b""
+            try:
+                if self._log_offset > offset:
+                    with open(old_log, "rb") as f:
+                        f.seek(offset)
+                        tail = f.read(self._log_offset - offset)
+                if self.keyed and tail:
+                    live = {item.run_id for item in items} | {item.run_id for item in appended_since}
+                    tail = b"".join(
+                        frame for frame, record in _iter_frames(tail)
+                        if record is None or record.run_id in live
+                    )
+                # The new log exists before the snapshot pointing at it
+                with open(self._log_path(generation + 1), "wb") as f:
+                    f.write(tail)
+                os.replace(tmp_file, self.storage_file)
+            except Exception as e:
+                print(f"Failed to save memory: {e}")
+                return False
+
+            self.buffer = items + appended_since
+            self._rebuild_indexes()
+            self._generation = generation + 1
+            self.rollover_due = False
+            self._log_records = len(appended_since)
+            self._log_offset = len(tail)
+            self._own_offsets = set()
+            self._snapshot_signature = self._stat_snapshot()
+            if os.path.exists(old_log):
+                os.remove(old_log)
+            return True
+
+    def roll_over(self, lock) -> bool:
+        """
+        Snapshot the whole buffer and start a new log generation. `lock`
+        (the backend's) is held only to mark the start and swap in the
+        result; the snapshot itself is written without it.
+        """
+        with lock:
+            if not self.rollover_due:
+                return False
+            self.rollover_due = False
+            mark = self.rewrite_mark()
+            items = self.buffer[:mark[1]]
+        tmp_file = self.write_rewrite(items, mark)
+        if tmp_file is None:
+            return False
+        with lock:
+            return self.finish_rewrite(tmp_file, items, mark)
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for path in (self.storage_file, self._log_path(self._generation)):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def remove_files(self) -> None:
+        with self._locked():
+            for path in (self.storage_file, self._log_path(self._generation)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class LogStorageBackend(StorageBackend):
+    """
+    Append-only log store, partitioned by record type.
+
+    Each partition (sessions, ads, pages, pitches, logs, users, records) is
+    its own LogSegment with separate snapshot and log files, loaded lazily on
+    first use. Building prospects therefore only reads the page and ad
+    segments; the log segment is read only when logs are asked for.
+    """
+
+    def __init__(self, storage_file: str = DEFAULT_STORAGE_FILE, snapshot_every: int = 500):
+        self.storage_file = storage_file
+        self.snapshot_every = snapshot_every
+        # Writes may arrive from PipelineContext's flush threads
+        self._lock = threading.RLock()
+        self._segments: Dict[str, LogSegment] = {}
+        # Migrated on first use, not here: the backend is created while
+        # custom_memory_session is still importing, before the record classes
+        # a legacy snapshot refers to exist.
+        self._migration_pending = os.path.exists(storage_file)
+
+    def _segment_file(self, partition: str) -> str:
+        root, ext = os.path.splitext(self.storage_file)
+        return f"{root}.{partition}{ext}"
+
+    def segment(self, partition: str) -> LogSegment:
+        """Return the partition's segment, loading it from disk on first use."""
+        with self._lock:
+            if self._migration_pending:
+                self._migration_pending = False
+                self._migrate_unpartitioned_store()
+            if partition not in self._segments:
+                self._segments[partition] = LogSegment(
+                    self._segment_file(partition), self.snapshot_every, keyed=partition in MUTABLE_TABLES
+                )
+            return self._segments[partition]
+
+    def _migrate_unpartitioned_store(self):
+        """
+        Split a store written before partitioning into per-type segments.
+        The legacy files are only removed once every record was read and
+        re-appended; otherwise they are kept and migration is retried on the
+        next start.
+        """
+        legacy = LogSegment(self.storage_file, self.snapshot_every)
+        if legacy.load_error is not None or legacy.skipped_records:
+            print(
+                f"Not migrating {self.storage_file}: it could not be read completely "
+                f"({legacy.load_error or f'{legacy.skipped_records} corrupt records'}); legacy files kept"
+            )
+            return
+
+        grouped: Dict[str, List[BufferItem]] = {}
+        for item in legacy.buffer:
+            grouped.setdefault(partition_for(item.data), []).append(item)
+        migrated = True
+        for partition, items in grouped.items():
+            segment = self.segment(partition)
+            migrated = segment.append_many(items) and segment.snapshot() and migrated
+        if not migrated:
+            print(f"Migration of {self.storage_file} incomplete; legacy files kept")
+            return
+
+        legacy.remove_files()
+        print(f"Migrated {len(legacy.buffer)} memory records into {len(grouped)} partitions")
+
+    def append(self, item: BufferItem) -> None:
+        self.append_many([item])
+
+    def append_many(self, items: List[BufferItem]) -> None:
+        grouped: Dict[str, List[BufferItem]] = {}
+        for item in items:
+            grouped.setdefault(partition_for(item.data), []).append(item)
+        with self._lock:
+            segments = [self.segment(partition) for partition in grouped]
+            for segment, partition_items in zip(segments, grouped.values()):
+                segment.append_many(partition_items)
+        self._roll_over_due(segments)
+
+    def _roll_over_due(self, segments: List[LogSegment]) -> None:
+        """Snapshot segments whose log is long enough, outside self._lock."""
+        for segment in segments:
+            if segment.rollover_due:
+                segment.roll_over(self._lock)
+
+    def query(
+        self,
+        *,
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        data_type: Optional[type] = None,
+    ) -> List[BufferItem]:
+        with self._lock:
+            groups = [
+                self.segment(partition).query(user_id=user_id, run_id=run_id, data_type=data_type)
+                for partition in partitions_for_type(data_type)
+            ]
+        return merge_partitions(groups)
+
+    def items(self) -> List[BufferItem]:
+        return self.query()
+
+    def find_user_by_email(self, email: str) -> Optional[BufferItem]:
+        with self._lock:
+            return self.segment(USERS_TABLE).find_by_email(email)
+
+    def find_user(self, user_id: str) -> Optional[BufferItem]:
+        with self._lock:
+            return self.segment(USERS_TABLE).find_by_user(user_id)
+
+    def persist(self, items: Optional[List[BufferItem]] = None) -> None:
+        """
+        Append the updated `items` to their partition's log (the last copy
+        wins on replay); with None, snapshot every loaded mutable partition.
+        """
+        with self._lock:
+            if items is None:
+                for partition in MUTABLE_TABLES:
+                    if partition in self._segments:
+                        self._segments[partition].snapshot()
+                return
+
+            grouped: Dict[str, List[BufferItem]] = {}
+            for item in items:
+                grouped.setdefault(partition_for(item.data), []).append(item)
+            segments = []
+            for partition, partition_items in grouped.items():
+                if partition in MUTABLE_TABLES:
+                    segments.append(self.segment(partition))
+                    segments[-1].write_back(partition_items)
+        self._roll_over_due(segments)
+
+    def compact(self, policy: RetentionPolicy, now: Optional[datetime] = None) -> CompactionReport:
+        """
+        Apply the policy partition by partition.
+
+        The policy is evaluated and the new snapshot written outside the
+        lock; the lock is only held to swap in the snapshot file and the
+        surviving records (plus anything appended in the meantime).
+        """
+        now = now or datetime.now()
+        report = CompactionReport()
+        for partition in TABLES:
+            if partition in PROTECTED_TABLES:
+                continue
+            if partition not in policy.ttl_days and policy.record_cap(partition) is None:
+                continue
+
+            segment = self.segment(partition)
+            with self._lock:
+                mark = segment.rewrite_mark()
+                current = segment.buffer[:mark[1]]
+            kept = policy.keep(partition, current, now)
+            if len(kept) == len(current):
+                continue
+
+            tmp_file = segment.write_rewrite(kept, mark)
+            if tmp_file is None:
+                continue
+            with self._lock:
+                bytes_before = segment.disk_bytes()
+                if segment.finish_rewrite(tmp_file, kept, mark):
+                    report.add(partition, len(current) - len(kept), max(bytes_before - segment.disk_bytes(), 0))
+        return report
+
+
+# -------------------------------------------------------------------------
+# SQLite backend
+# -------------------------------------------------------------------------
+class SQLiteStorageBackend(StorageBackend):
+    """
+    SQLite storage engine (WAL mode) with one typed table per record type.
+
+    Each table keeps the lookup columns (user_id, session_id, page_id,
+    email) next to the pickled record, indexed so reads only touch matching
+    rows. WAL lets several worker processes read while one writes.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_SQLITE_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        # Open sessions (row id -> record) are mutated in place; persist()
+        # writes them back and drops them, so this only holds open sessions
+        self._live_sessions: Dict[int, BufferItem] = {}
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            for table in TABLES:
+                self._conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        page_id TEXT,
+                        email TEXT,
+                        type_name TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        payload BLOB NOT NULL
+                    )
+                    """
+                )
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table} (user_id)")
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_session ON {table} (session_id)")
+                if table in PAGE_KEYED_TABLES:
+                    self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_page ON {table} (page_id)")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{USERS_TABLE}_email ON {USERS_TABLE} (email)")
+
+    def append(self, item: BufferItem) -> None:
+        self.append_many([item])
+
+    def append_many(self, items: List[BufferItem]) -> None:
+        """Insert all records in one transaction."""
+        with self._lock, self._conn:
+            for item in items:
+                table = partition_for(item.data)
+                email = item.data.get("email") if table == USERS_TABLE else None
+                cursor = self._conn.execute(
+                    f"""
+                    INSERT INTO {table} (user_id, session_id, page_id, email, type_name, timestamp, payload)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        item.user_id,
+                        item.run_id,
+                        _page_id_of(item.data),
+                        email,
+                        type(item.data).__name__,
+                        item.timestamp,
+                        pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL),
+                    ),
+                )
+                if table in MUTABLE_TABLES:
+                    self._live_sessions[cursor.lastrowid] = item
+
+    def query(
+        self,
+        *,
+        user_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        data_type: Optional[type] = None,
+    ) -> List[BufferItem]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if run_id is not None:
+            clauses.append("session_id = ?")
+            params.append(run_id)
+        if data_type is not None:
+            clauses.append("type_name = ?")
+            params.append(data_type.__name__)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        groups: List[List[BufferItem]] = []
+        with self._lock:
+            for table in partitions_for_type(data_type):
+                rows = self._conn.execute(
+                    f"SELECT id, payload FROM {table} {where} ORDER BY id", params
+                ).fetchall()
+                groups.append(self._load_rows(table, rows))
+        return merge_partitions(groups)
+
+    def _load_rows(self, table: str, rows: List[Tuple[int, bytes]]) -> List[BufferItem]:
+        items: List[BufferItem] = []
+        for row_id, payload in rows:
+            # Hand out the live object so in-place session updates are kept
+            if table in MUTABLE_TABLES and row_id in self._live_sessions:
+                items.append(self._live_sessions[row_id])
+                continue
+            try:
+                items.append(pickle.loads(payload))
+            except Exception as e:
+                print(f"Skipping corrupt memory record {table}#{row_id}: {e}")
+        return items
+
+    def items(self) -> List[BufferItem]:
+        return self.query()
+
+    def _find_one_user(self, column: str, value: str) -> Optional[BufferItem]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, payload FROM {USERS_TABLE} WHERE {column} = ? ORDER BY id LIMIT 1", (value,)
+            ).fetchall()
+            items = self._load_rows(USERS_TABLE, rows)
+        return items[0] if items else None
+
+    def find_user_by_email(self, email: str) -> Optional[BufferItem]:
+        return self._find_one_user("email", email)
+
+    def find_user(self, user_id: str) -> Optional[BufferItem]:
+        return self._find_one_user("user_id", user_id)
+
+    def persist(self, items: Optional[List[BufferItem]] = None) -> None:
+        with self._lock, self._conn:
+            if items is None:
+                targets = list(self._live_sessions.items())
+            else:
+                run_ids = {item.run_id for item in items}
+                targets = [
+                    (row_id, item) for row_id, item in self._live_sessions.items() if item.run_id in run_ids
+                ]
+            for row_id, item in targets:
+                self._conn.execute(
+                    "UPDATE sessions SET payload = ? WHERE id = ?",
+                    (pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL), row_id),
+                )
+                del self._live_sessions[row_id]
+
+    def compact(self, policy: RetentionPolicy, now: Optional[datetime] = None) -> CompactionReport:
+        """
+        Delete expired / over-cap rows in one short transaction per table.
+
+        bytes_reclaimed counts the payload bytes of deleted rows; SQLite
+        reuses that space for new rows rather than shrinking the file.
+        """
+        now = now or datetime.now()
+        report = CompactionReport()
+        for table in TABLES:
+            if table in PROTECTED_TABLES:
+                continue
+            cutoff = policy.cutoff(table, now)
+            cap = policy.record_cap(table)
+            if cutoff is None and cap is None:
+                continue
+
+            conditions: List[str] = []
+            params: List[Any] = []
+            if cutoff is not None:
+                conditions.append("timestamp < ?")
+                params.append(cutoff)
+            if cap is not None:
+                conditions.append(
+                    f"""id IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id DESC) AS rank
+                            FROM {table}
+                        ) WHERE rank > ?
+                    )"""
+                )
+                params.append(cap)
+            where = " OR ".join(conditions)
+
+            with self._lock, self._conn:
+                removed, reclaimed = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM {table} WHERE {where}",
+                    params,
+                ).fetchone()
+                if removed:
+                    self._conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+                    if table in MUTABLE_TABLES and self._live_sessions:
+                        self._drop_deleted_live_sessions(table)
+            report.add(table, removed, reclaimed)
+        return report
+
+    def _drop_deleted_live_sessions(self, table: str) -> None:
+        row_ids = list(self._live_sessions)
+        placeholders = ",".join("?" * len(row_ids))
+        remaining = {
+            row_id
+            for (row_id,) in self._conn.execute(f"SELECT id FROM {table} WHERE id IN ({placeholders})", row_ids)
+        }
+        for row_id in row_ids:
+            if row_id not in remaining:
+                del self._live_sessions[row_id]
+
+    def close(self) -> None:
+        self.persist()
+        with self._lock:
+            self._conn.close()
+
+
+def create_backend_from_env() -> StorageBackend:
+    """Select the storage engine via MEMORY_BACKEND ("log" or "sqlite")."""
+    kind = os.getenv("MEMORY_BACKEND", "log").lower()
+    if kind == "sqlite":
+        return SQLiteStorageBackend(os.getenv("MEMORY_SQLITE_PATH", DEFAULT_SQLITE_FILE))
+    if kind == "log":
+        return LogStorageBackend(os.getenv("MEMORY_STORE_PATH", DEFAULT_STORAGE_FILE))
+    raise RuntimeError(f"Unknown MEMORY_BACKEND: {kind}")
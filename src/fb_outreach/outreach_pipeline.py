@@ -1,24 +1,42 @@
 import asyncio
+import time
 from fb_outreach.agent import pitch_prompt, PitchService, UserData
 import os
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from datetime import datetime
-from fb_outreach.facebook_ads_service import FacebookAdsService, AdsRequest
-from fb_outreach.apify_service import ApifyService
+from fb_outreach.facebook_ads_service import AdsFetchError, FacebookAdsService, AdsRequest, watermark_key
+from fb_outreach.schemas import FacebookAdsPaging
+from fb_outreach.apify_service import ApifyService, PageBatchResult, get_apify_service
 from fb_outreach.agent import PitchService, pitch_prompt
 from dotenv import load_dotenv
 from fb_outreach.custom_memory_session import PipelineContext, memory
-from fb_outreach.prospect_builder import build_prospects
+from fb_outreach.data_transformers import transform_to_prospect_context
+from fb_outreach.pitch_generation_service import PitchGenerationService
+from fb_outreach.schemas import ProspectContext
 
 load_dotenv()
 
+# Workers per stage and room between stages. A full pitch queue blocks the
+# scrape workers, and a full scrape queue stops paging through the Ads Library.
+SCRAPE_WORKERS = int(os.getenv("PIPELINE_SCRAPE_WORKERS", "10"))
+PITCH_WORKERS = int(os.getenv("PIPELINE_PITCH_WORKERS", "3"))
+STAGE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+PITCH_USER_INPUT = "Generate and send pitch email"
+
 # ------------------------------------------------------------------
 # Helper function to process a single ad
 # ------------------------------------------------------------------
-async def process_ad(idx: int, ad: Dict, results: Dict, ctx: PipelineContext):
+async def process_ad(
+    idx: int,
+    ad: Dict,
+    results: Dict,
+    ctx: PipelineContext,
+    paging: Optional[FacebookAdsPaging] = None,
+) -> List[ProspectContext]:
+    """Saves the ad, scrapes its page and returns the prospects built from the two."""
     page_id = ad.get("page_id")
     print(f"Processing ad {idx} with page_id={page_id}")
-    await ctx.save_ad(ad)
+    ad_record = await ctx.save_ad(ad, paging=paging)
     print("ad saved")
     print(f"ad: {ad}")
     if not page_id:
@@ -28,7 +46,16 @@ async def process_ad(idx: int, ad: Dict, results: Dict, ctx: PipelineContext):
             f"Ad {idx} has no page_id",
         )
         results["skipped"] += 1
-        return
+        return []
+
+    if ad_record is None:
+        await ctx.log_step(
+            "known_ad",
+            "skipped",
+            f"Ad {idx} was already saved by an earlier run",
+        )
+        results["skipped"] += 1
+        return []
 
     await ctx.log_step(
         "processing_page",
@@ -36,22 +63,17 @@ async def process_ad(idx: int, ad: Dict, results: Dict, ctx: PipelineContext):
         f"[{idx}] Processing page_id={page_id}",
     )
 
-    apify_client = ApifyService(api_token=os.getenv("APIFY_API_KEY"))
-
-    await asyncio.sleep(2)
+    # Shared client; its limiter paces actor starts instead of a fixed sleep
+    apify_client = get_apify_service()
 
     try:
-        run = await apify_client.scrape_facebook_page(page_id)
-        print(f"apify_run: {run}")
-        dataset_id = run["defaultDatasetId"]
-        apify_items = await apify_client.fetch_dataset(dataset_id)
-        
-        print(f"apify_items: {apify_items}")
-        
-        for apify_item in apify_items:
-            # print(f"apify_item: {apify_item}")
-            if not apify_items:
-                raise RuntimeError("Dataset empty")
+        # Goes through the shared page cache: recently scraped or in-flight pages are reused
+        report = PageBatchResult()
+        apify_items = [
+            item async for _, item in apify_client.stream_facebook_pages([page_id], report=report)
+        ]
+        if page_id in report.failed:
+            raise RuntimeError(report.failed[page_id])
 
     except Exception as e:
         await ctx.log_step(
@@ -61,8 +83,9 @@ async def process_ad(idx: int, ad: Dict, results: Dict, ctx: PipelineContext):
             details={"error": str(e)},
         )
         results["failed"] += 1
-        return
+        return []
 
+    apify_item = apify_items[-1] if apify_items else None
     if not apify_item:
         await ctx.log_step(
             "apify_no_data",
@@ -70,52 +93,67 @@ async def process_ad(idx: int, ad: Dict, results: Dict, ctx: PipelineContext):
             f"No Apify data for page_id={page_id}",
         )
         results["skipped"] += 1
-        return
+        return []
     print(f"Saving page {apify_item}")
-    await ctx.save_page(apify_item)
+    pages = await ctx.save_page(apify_item)
     print(f"Page saved")
 
-    # # -------------------------------
-    # # BUILD PROSPECT CONTEXTS
-    # # -------------------------------
-    # prospects = build_prospects(user_id)
-
-    # await ctx.log_step(
-    #     "prospects_built",
-    #     "success",
-    #     f"Built {len(prospects)} valid prospects"
-    # )
-
-    # try:
-    #     pitch_service = PitchService(api_key=os.getenv("GEMINI_API_KEY"))
-    #     pitch = pitch_service.generate_pitch(
-    #         "Generate and send pitch email",
-
-    #     )
-
-    #     await ctx.save_pitch(page_id, email, pitch)
+    # Same pairing as build_prospects, without re-reading the whole store
+    return [
+        transform_to_prospect_context(page=page, ad=ad_record, fallback_email=None)
+        for page in pages
+    ]
+
+
+def start_workers(
+    queue: asyncio.Queue,
+    count: int,
+    handle: Callable[[Any], Awaitable[None]],
+    on_error: Callable[[Any, Exception], Awaitable[None]],
+) -> List[asyncio.Task]:
+    """`count` tasks that run `handle` on every queue item until cancelled."""
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                await handle(item)
+            except Exception as e:
+                # A dead worker would leave queue.join() waiting forever
+                await on_error(item, e)
+            finally:
+                queue.task_done()
 
-    #     await ctx.log_step(
-    #         "pitch_generated",
-    #         "success",
-    #         f"Pitch generated for {page_name}",
-    #     )
+    return [asyncio.create_task(worker()) for _ in range(max(1, count))]
 
-    #     results["success"] += 1
 
-    # except Exception as e:
-    #     await ctx.log_step(
-    #         "pitch_error",
-    #         "failed",
-    #         f"Pitch generation failed for {page_name}",
-    #         details={"error": str(e)},
-    #     )
-    #     results["failed"] += 1
+async def stop_workers(workers: List[asyncio.Task]) -> None:
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
 
 # ------------------------------------------------------------------
 # Main Pipeline
 # ------------------------------------------------------------------
-async def pipeline_run(user_id: str = "default_user") -> Dict:
+async def pipeline_run(
+    user_id: str = "default_user",
+    max_ads: Optional[int] = None,
+    max_pages: Optional[int] = None,
+    pitch_service: Optional[PitchService] = None,
+    scrape_workers: int = SCRAPE_WORKERS,
+    pitch_workers: int = PITCH_WORKERS,
+    queue_size: int = STAGE_QUEUE_SIZE,
+) -> Dict:
+    """
+    Ads -> scrape -> pitch, as stages joined by bounded queues:
+
+    - the ads stage pages through the Ads Library and queues every ad,
+    - `scrape_workers` save each ad, scrape its page and queue the prospects,
+    - `pitch_workers` generate and save a pitch per prospect.
+
+    A prospect is pitched as soon as its page is scraped. Without a
+    `pitch_service`, prospects are built and counted but not pitched.
+    """
+    started = time.perf_counter()
     async with PipelineContext(user_id=user_id) as ctx:
         fb_service = FacebookAdsService(
             access_token=os.getenv("FB_ACCESS_TOKEN")
@@ -136,109 +174,167 @@ async def pipeline_run(user_id: str = "default_user") -> Dict:
             details=ads_req.model_dump(),
         )
 
-        try:
-            ads = fb_service.fetch_ads(ads_req)
-        except Exception as e:
-            await ctx.log_step(
-                "ads_fetch_error",
-                "failed",
-                str(e),
-            )
-            raise
-
-        if not ads or not ads.get("data"):
-            await ctx.log_step(
-                "ads_fetch_empty",
-                "completed",
-                "No ads found",
-            )
-            # return {"total": 0}
-
-        await ctx.log_step(
-            "ads_fetched",
-            "success",
-            f"Fetched {len(ads['data'])} ads",
-        )
-
         results = {
-            "total": len(ads["data"]),
+            "total": 0,
             "success": 0,
             "failed": 0,
             "skipped": 0,
+            "prospects": 0,
+            "missing_email": 0,
+            "time_to_first_pitch_seconds": None,
+            "wall_seconds": None,
         }
 
-        tasks = [
-            process_ad(idx + 1, ad, results, ctx)
-            for idx, ad in enumerate(ads["data"])
-        ]
+        pitch_generation = None
+        if pitch_service is not None:
+            pitch_generation = PitchGenerationService(
+                pitch_service=pitch_service,
+                persist_pitch=lambda prospect, pitch: ctx.save_pitch(
+                    page_id=prospect.page_id,
+                    email=prospect.email,
+                    content=pitch,
+                ),
+            )
 
-        await asyncio.gather(*tasks)
+        scrape_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        pitch_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
 
-        # memory.save_memory(user_id, ctx)
-        
         # --------------------------------
-        # BUILD PROSPECT CONTEXTS (ONE TIME)
+        # SCRAPE STAGE: ad -> page -> prospects
         # --------------------------------
-        print(f"user_id:  {user_id}")
-
-        # items = memory.get_memory(user_id)
-
-        # print(f"stored_data: {items}")
-
-        prospects = build_prospects(user_id)
-
-        print(f"prospects: {prospects}")
-
-        if prospects is None or len(prospects) == 0:
+        async def scrape(job):
+            idx, ad, paging = job
+            for prospect in await process_ad(idx, ad, results, ctx, paging):
+                results["prospects"] += 1
+                if not prospect.is_valid_for_outreach():
+                    results["missing_email"] += 1
+                    await ctx.log_step(
+                        "prospect_missing_email",
+                        "skipped",
+                        f"No valid email for {prospect.page_name}",
+                    )
+                elif pitch_generation is not None:
+                    # Blocks while the pitch stage is saturated
+                    await pitch_queue.put(prospect)
+
+        async def scrape_failed(job, e):
+            results["failed"] += 1
             await ctx.log_step(
-                "prospects_built",
+                "processing_error",
                 "failed",
-                "No prospects found",
+                f"Ad {job[0]} failed",
+                details={"error": str(e)},
             )
-            # return {"total": 0}
 
-        await ctx.log_step(
-            "prospects_built",
-            "success",
-            f"Built {len(prospects)} valid prospects"
-        )
-        
         # --------------------------------
-        # GENERATE PITCHES
+        # PITCH STAGE
         # --------------------------------
-        print(f"Generating pitches for {len(prospects)} prospects")
+        async def pitch(prospect: ProspectContext):
+            response = await pitch_generation.generate(
+                user_input=PITCH_USER_INPUT,
+                prospects=[prospect],
+            )
+            outcome = response["results"][0]
+            if outcome["status"] != "generated":
+                raise RuntimeError(outcome["error"] or outcome["status"])
+
+            results["success"] += 1
+            if results["time_to_first_pitch_seconds"] is None:
+                results["time_to_first_pitch_seconds"] = round(time.perf_counter() - started, 3)
+            print(f"Pitch saved for {prospect.page_name}")
+            await ctx.log_step(
+                "pitch_generated",
+                "success",
+                f"Pitch generated for {prospect.page_name}"
+            )
+
+        async def pitch_failed(prospect: ProspectContext, e):
+            results["failed"] += 1
+            await ctx.log_step(
+                "pitch_error",
+                "failed",
+                f"Pitch failed for {prospect.page_name}",
+                details={"error": str(e)}
+            )
+
+        workers = start_workers(scrape_queue, scrape_workers, scrape, scrape_failed)
+        workers += start_workers(pitch_queue, pitch_workers, pitch, pitch_failed)
+
+        try:
+            # --------------------------------
+            # ADS STAGE
+            # --------------------------------
+            # Only ads newer than earlier runs of this search are fetched and stored
+            watermark = await ctx.load_watermark(watermark_key(ads_req))
+            ads_budget = max_ads if max_ads is not None else ads_req.limit
+            last_paging = None
 
-        for prospect in prospects:
             try:
-                # print(f"Generating pitch for {prospect.page_name}")
-                pitch = pitch_service.generate_pitch(
-                    user_input="Generate and send pitch email",
-                    context=prospect,
+                async for page_ads, paging in fb_service.iter_ad_pages(
+                    ads_req,
+                    max_ads=ads_budget,
+                    max_pages=max_pages,
+                    watermark=watermark,
+                ):
+                    last_paging = paging
+                    for ad in page_ads:
+                        results["total"] += 1
+                        # Blocks while the scrape stage is saturated
+                        await scrape_queue.put((results["total"], ad, paging))
+            except AdsFetchError as e:
+                # Ads already queued are still processed; last_paging keeps its
+                # next_url, so the watermark date does not advance
+                await ctx.log_step(
+                    "ads_fetch_error",
+                    "failed",
+                    str(e),
                 )
-                print(f"Pitch: {pitch}")
-
-                await ctx.save_pitch(
-                    page_id=prospect.page_id,
-                    email=prospect.email,
-                    content=pitch
+            except Exception as e:
+                await ctx.log_step(
+                    "ads_fetch_error",
+                    "failed",
+                    str(e),
                 )
+                raise
 
-                print(f"Pitch saved for {prospect.page_name}")
-                
+            if not results["total"]:
                 await ctx.log_step(
-                    "pitch_generated",
-                    "success",
-                    f"Pitch generated for {prospect.page_name}"
+                    "ads_fetch_empty",
+                    "completed",
+                    "No ads found",
                 )
 
-            except Exception as e:
+            await ctx.log_step(
+                "ads_fetched",
+                "success",
+                f"Fetched {results['total']} ads",
+            )
+
+            await scrape_queue.join()
+            # Budget-limited runs may have left older ads unread: keep the date watermark then
+            await ctx.save_watermark(
+                exhausted=last_paging is not None
+                and last_paging.next_url is None
+                and results["total"] < ads_budget
+            )
+
+            await ctx.log_step(
+                "prospects_built",
+                "success" if results["prospects"] else "failed",
+                f"Built {results['prospects']} prospects, {results['missing_email']} without a valid email",
+            )
+            if pitch_generation is None and results["prospects"]:
                 await ctx.log_step(
-                    "pitch_error",
-                    "failed",
-                    f"Pitch failed for {prospect.page_name}",
-                    details={"error": str(e)}
+                    "pitch_skipped",
+                    "skipped",
+                    "No PitchService given; prospects were not pitched",
                 )
 
+            await pitch_queue.join()
+        finally:
+            await stop_workers(workers)
+
+        results["wall_seconds"] = round(time.perf_counter() - started, 3)
         await ctx.log_step(
             "pipeline_summary",
             "success",
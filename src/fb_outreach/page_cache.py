@@ -0,0 +1,114 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fb_outreach.blob_store import blob_store
+
+
+class PageScrapeCache:
+    """
+    Scraped Facebook pages shared by every user, keyed by page_id.
+
+    A page scraped less than `ttl_seconds` ago is served from here instead of
+    starting another paid Apify run. Items are kept as blob-store references,
+    so an entry costs a digest per item, not the page payload (which is only
+    held in memory until the next store flush writes it).
+
+    Single flight: the first caller to miss on a page `claim`s it and must
+    `resolve` it; concurrent callers `wait` on the same future instead of
+    scraping the page again.
+    """
+
+    def __init__(self, ttl_seconds: float = 86400, max_entries: int = 10000, cost_per_page: float = 0.01):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.cost_per_page = cost_per_page
+        self._entries: "OrderedDict[str, Tuple[float, List[Any]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def lookup(self, page_id: str) -> Tuple[Optional[List[Any]], Optional[asyncio.Future]]:
+        """
+        (items, None) on a fresh hit, (None, future) when another caller is
+        already scraping the page, (None, None) when the caller should claim it.
+        """
+        if not self.enabled:
+            return None, None
+        with self._lock:
+            entry = self._entries.get(page_id)
+            if entry is not None:
+                fetched_at, items = entry
+                if time.monotonic() - fetched_at < self.ttl_seconds:
+                    self._entries.move_to_end(page_id)
+                    self.hits += 1
+                    return items, None
+                del self._entries[page_id]
+                self.expirations += 1
+            future = self._inflight.get(page_id)
+            if future is not None and not future.done():
+                self.coalesced += 1
+                return None, future
+            return None, None
+
+    def claim(self, page_id: str) -> None:
+        """Mark `page_id` as being scraped by the caller (counts as a miss)."""
+        with self._lock:
+            self.misses += 1
+            if self.enabled:
+                self._inflight[page_id] = asyncio.get_running_loop().create_future()
+
+    def resolve(self, page_id: str, items: Optional[List[Dict[str, Any]]]) -> None:
+        """
+        Finish a claimed scrape. `items` None means it failed: waiters get None
+        and nothing is cached.
+        """
+        stored = [blob_store.stage(item) for item in items] if items and self.enabled else None
+        with self._lock:
+            future = self._inflight.pop(page_id, None)
+            if stored:
+                self._entries[page_id] = (time.monotonic(), stored)
+                self._entries.move_to_end(page_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if future is not None and not future.done():
+            future.set_result(stored if stored else items)
+
+    @staticmethod
+    async def wait(future: asyncio.Future) -> Optional[List[Any]]:
+        # shield: one waiter being cancelled must not cancel the shared scrape
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = self.hits + self.coalesced
+            lookups = saved + self.misses
+            return {
+                "entries": len(self._entries),
+                "in_flight": len(self._inflight),
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "hit_rate": round(saved / lookups, 3) if lookups else 0.0,
+                "scrapes_saved": saved,
+                "dollars_saved": round(saved * self.cost_per_page, 4),
+            }
+
+
+page_cache = PageScrapeCache(
+    ttl_seconds=float(os.getenv("PAGE_CACHE_TTL_SECONDS", "86400")),
+    max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "10000")),
+    cost_per_page=float(os.getenv("APIFY_COST_PER_PAGE_USD", "0.01")),
+)
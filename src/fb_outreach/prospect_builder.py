@@ -94,24 +94,21 @@ from fb_outreach.data_transformers import transform_to_prospect_context
 def get_pages_and_ads(user_id: str):
     print(f"Getting pages and ads for user_id: {user_id}")
 
-    items = memory.get_memory(user_id)
-
     pages: List[ApifyFacebookPageData] = [
         item.data
-        for item in items
-        if isinstance(item.data, ApifyFacebookPageData)
+        for item in memory.get_memory(user_id, ApifyFacebookPageData)
     ]
 
     ads: List[FacebookAdsResponse] = [
         item.data
-        for item in items
-        if isinstance(item.data, FacebookAdsResponse)
+        for item in memory.get_memory(user_id, FacebookAdsResponse)
     ]
 
+    # Counts only: printing the records would decode every raw_data blob
     print("**************************************")
-    print(f"pages_data: {pages}")
+    print(f"pages_data: {len(pages)} pages")
     print("**************************************")
-    print(f"ads_data: {ads}")
+    print(f"ads_data: {len(ads)} ads")
     print("**************************************")
 
     return {
@@ -203,15 +200,15 @@ def build_prospects(user_id: str) -> Tuple[List[ProspectContext], List[Dict]]:
     data = get_pages_and_ads(user_id)
     ad_map = match_ads_by_page_id(data["ads"])
 
-    print(f"ad_map: {ad_map}")
-
     # deduplicate pages by page_id
-    unique_pages: Dict[str, ApifyFacebookPageData] = {
-        page.raw_data["pageAdLibrary"]["id"]: page for page in data["pages"]
-        if page.raw_data["pageAdLibrary"]["id"]
-    }
+    unique_pages: Dict[str, ApifyFacebookPageData] = {}
+    for page in data["pages"]:
+        # Older records predate ad_library_page_id and need the raw payload
+        page_id = page.ad_library_page_id or page.raw_data["pageAdLibrary"]["id"]
+        if page_id:
+            unique_pages[page_id] = page
 
-    print(f"unique_pages: {unique_pages}")
+    print(f"unique_pages: {list(unique_pages)}")
 
     prospects: List[ProspectContext] = []
     missing_email_pages: List[Dict] = []
@@ -221,7 +218,7 @@ def build_prospects(user_id: str) -> Tuple[List[ProspectContext], List[Dict]]:
         print(f"Processing page_id: {page_id}")
 
         matched_ads = ad_map.get(page_id, [])
-        print(f"matched_ads: {matched_ads}")
+        print(f"matched_ads: {[ad.ad_id for ad in matched_ads]}")
         print("=============================================")
 
         if not matched_ads:
@@ -229,13 +226,13 @@ def build_prospects(user_id: str) -> Tuple[List[ProspectContext], List[Dict]]:
             continue
 
         for ad in matched_ads:
-            print(f"inside_loop_ad: {ad}")
+            print(f"inside_loop_ad: {ad.ad_id}")
             prospect = transform_to_prospect_context(
                 page=page,
                 ad=ad,
                 fallback_email=None,
             )
-            print(f"prospect: {prospect}")
+            print(f"prospect: {prospect.get_summary()}")
 
             # ✅ Only keep prospects with valid email
             if prospect.is_valid_for_outreach():
@@ -3,10 +3,13 @@ from fastapi.responses import JSONResponse
 from fb_outreach.dependencies import get_current_user_id, get_authenticated_user
 from fb_outreach.custom_memory_session import memory, PipelineContext
 from typing import List, Annotated
-from fb_outreach.facebook_ads_service import FacebookAdsService
-from fb_outreach.apify_service import ApifyService
+from fb_outreach.facebook_ads_service import FacebookAdsService, watermark_key
+from fb_outreach.ads_query_planner import plan_sub_queries, fetch_ads_fanout
+from fb_outreach.ads_cache import ads_cache
+from fb_outreach.apify_service import ApifyService, PageBatchResult, get_apify_service
+from fb_outreach.page_cache import page_cache
 from fastapi import Query
-from fb_outreach.schemas import AdsRequest, AdsResponse, Paging
+from fb_outreach.schemas import AdsRequest, AdsResponse, Paging, PipelineRunRequest, PipelineRunResponse
 from dotenv import load_dotenv
 from fb_outreach.schemas import (
     ApifyFacebookPageData,
@@ -14,7 +17,9 @@ from fb_outreach.schemas import (
     FacebookAdData,
 )
 import os
+from dataclasses import asdict
 from fb_outreach.outreach_pipeline import pipeline_run
+from fb_outreach.agent import get_pitch_service
 
 from fastapi import FastAPI, Request, HTTPException, Query, Path, Cookie, Header, Form, status
 from fastapi.responses import JSONResponse
@@ -24,7 +29,13 @@ from fastapi.responses import RedirectResponse
 from typing import Annotated, Any
 # from class_1.mock import fake_products
 from fb_outreach.custom_memory_session import memory
-from fb_outreach.security import hash_password, verify_password, create_manual_token, verify_manual_token
+from fb_outreach.security import (
+    hash_password_async,
+    verify_password_async,
+    login_governor,
+    create_manual_token,
+    verify_manual_token,
+)
 import uuid
 from pydantic import BaseModel
 
@@ -58,13 +69,15 @@ class UserLogin(BaseModel):
 @router.post("/signup")
 async def signup(user: UserSignup):
     # Check if email already exists
-    for user_item in memory.buffer:
-        # print(user_item.data)
-        if user_item.data.get("email") == user.email:
-            raise HTTPException(status_code=400, detail="Email already registered")
+    if memory.get_user_by_email(user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password & create user
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
+    # A concurrent signup may have taken the email while we were hashing;
+    # re-check and insert with no await in between so only one can win
+    if memory.get_user_by_email(user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
     user_id = str(uuid.uuid4())
     memory.add_memory(data={"email": user.email, "password": hashed_password}, user_id=user_id, run_id="run_1")
 
@@ -73,28 +86,32 @@ async def signup(user: UserSignup):
 
 @router.post("/login")
 async def login(user: UserLogin):
-    for user_item in memory.buffer:
-        if user_item.data.get("email") == user.email:
-            if verify_password(user.password, user_item.data.get("password")):
-                token = create_manual_token(user_item.user_id)
-
-                response = JSONResponse({"msg": "login success"})
-
-                response.set_cookie(
-                key="access_token",
-                    value=token,
-                    httponly=True,
-                    # secure=False,
-                    secure=True,
-                    # secure=True,
-                    samesite="none",
-                    max_age=60 * 60 * 24,
-                    path="/"
-                )
-                # print("Logged in successfully")
-                return response
+    user_item = memory.get_user_by_email(user.email)
+    if not user_item:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    async with login_governor.slot():
+        password_ok = await verify_password_async(user.password, user_item.data.get("password"))
+
+    if password_ok:
+        token = create_manual_token(user_item.user_id)
+
+        response = JSONResponse({"msg": "login success"})
+
+        response.set_cookie(
+        key="access_token",
+            value=token,
+            httponly=True,
+            # secure=False,
+            secure=True,
+            # secure=True,
+            samesite="none",
+            max_age=60 * 60 * 24,
+            path="/"
+        )
+        # print("Logged in successfully")
+        return response
 
-            raise HTTPException(status_code=401, detail="Invalid credentials")
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 # Step 4: Protected route mein use karo
@@ -245,6 +262,12 @@ async def me(user = Depends(get_authenticated_user)):
 
 
 
+@router.get("/fetch/cache")
+async def ads_cache_stats(user_id: str = Depends(get_current_user_id)):
+    """Hit/miss counters of the ads_archive response cache."""
+    return ads_cache.stats()
+
+
 # ---------------------------------
 # version 2
 @router.post("/fetch")
@@ -262,13 +285,25 @@ async def fetch_facebook_ads(payload: AdsRequest, user_id: str = Depends(get_cur
                 "AdsRequest created",
                 details=payload.model_dump(),
             )
-            result = ads_service.fetch_ads(payload)
+            watermark = None
+            if payload.incremental:
+                watermark = await ctx.load_watermark(watermark_key(payload))
+
+            if len(plan_sub_queries(payload)) > 1:
+                # Multi-term / multi-country: one sub-query per pair, merged and deduped
+                fanout = await fetch_ads_fanout(ads_service, payload, watermark=watermark)
+                result = fanout.to_dict()
+                # Sub-queries stop after one page, so only ad ids can be trusted
+                exhausted = False
+            else:
+                result = await ads_service.fetch_ads_async(payload, watermark=watermark)
+                exhausted = bool(result) and not (result.get("paging") or {}).get("next")
 
             # print(f"result: {result}")
             # print(f"type of result: {type(result)}")
             # print(f"ads_data: {result.get('data')}")  # changed double quotes inside to single quotes
     
-            if not result or not result.get("data"):
+            if not result or (not result.get("data") and watermark is None):
                 await ctx.log_step( 
                     "ads_fetch_empty",
                     "completed",
@@ -287,13 +322,16 @@ async def fetch_facebook_ads(payload: AdsRequest, user_id: str = Depends(get_cur
             )
 
             # Loop through each ad and save separately
+            saved = 0
             for ad in result.get("data"):
-                await ctx.save_ad(ad)
+                if await ctx.save_ad(ad):
+                    saved += 1
+            await ctx.save_watermark(exhausted=exhausted)
 
             await ctx.log_step(
                 "ads_saved",
                 "success",
-                f"Saved {len(result['data'])} ads",
+                f"Saved {saved} new ads",
             )
 
 
@@ -369,44 +407,58 @@ async def fetch_facebook_ads(payload: AdsRequest, user_id: str = Depends(get_cur
 #         return pages
 
 
+@router.get("/pages/cache")
+async def page_cache_stats(user_id: str = Depends(get_current_user_id)):
+    """Hit rate and Apify spend saved by the shared page-scrape cache."""
+    return page_cache.stats()
+
+
 ## version 2
 @router.get("/pages")
-async def fetch_pages(user_id: str = Depends(get_current_user_id)):
+async def fetch_pages(full_payload: bool = False, user_id: str = Depends(get_current_user_id)):
+    """Scrapes the pages behind saved ads; `full_payload=true` keeps every dataset field (audits)."""
     pages = []
     # print(f"user_id: {user_id}")
     async with PipelineContext(user_id=user_id) as ctx:
-        apify_client = ApifyService(api_token=os.getenv("APIFY_API_KEY"))
-        items = memory.get_memory(user_id)
+        apify_client = get_apify_service()
+        items = memory.get_memory(user_id, FacebookAdsResponse)
         # print(f"items count: {len(items)}")
         
         page_ids = set()
 
         for item in items:
-            data = item.data
-            # print(f"_data_: {data}")
-            if hasattr(data, 'ads') and isinstance(data, FacebookAdsResponse):
-                
-                for ad in data.ads:
-                    if hasattr(ad, 'page_id') and ad.page_id:
-                        page_ids.add(ad.page_id)
+            for ad in item.data.ads:
+                if ad.page_id:
+                    page_ids.add(ad.page_id)
 
         # print(f"Unique page_ids found: {page_ids}")
 
-        for page_id in page_ids:
-            try:
-                # print(f"Fetching data for page_id: {page_id}")
-                run = await apify_client.scrape_facebook_page(page_id)
-                dataset_id = run["defaultDatasetId"]
-                apify_items = await apify_client.fetch_dataset(dataset_id)
-                # print(f"Fetched {len(apify_items)} items for page_id {page_id}")
+        # One actor run per batch of pages; items are saved while datasets page in
+        report = PageBatchResult()
+        async for page_id, page_data in apify_client.stream_facebook_pages(
+            page_ids, report=report, full_payload=full_payload or None
+        ):
+            await ctx.save_page(page_data)
+            pages.append(page_data)
 
-                for page_data in apify_items:
-                    # print(f"Appending page_data for page_id {page_id}")
-                    await ctx.save_page(page_data)
-                    pages.append(page_data)
+        for transfer in report.transfers:
+            await ctx.log_step(
+                "apify_transfer",
+                "completed",
+                f"Run {transfer.run_id}: {transfer.bytes_downloaded} bytes downloaded, "
+                f"~{transfer.bytes_saved} bytes saved by field projection",
+                details={**asdict(transfer), "bytes_saved": transfer.bytes_saved},
+            )
+
+        for page_id, error in report.failed.items():
+            await ctx.log_step("apify_error", "failed", f"Failed for page_id={page_id}", details={"error": error})
 
-            except Exception as e:
-                await ctx.log_step("apify_error", "failed", f"Failed for page_id={page_id}", details={"error": str(e)})
+        if report.unmatched_count:
+            await ctx.log_step(
+                "apify_unmatched",
+                "completed",
+                f"{report.unmatched_count} dataset items matched no requested page_id",
+            )
 
         # print(f"Total pages returned: {len(pages)}")
         return pages
@@ -417,8 +469,20 @@ async def run_pipeline(req: PipelineRunRequest):
     """
     Trigger pipeline execution using form/JSON input
     """
+    pitch_service = get_pitch_service()
+    if pitch_service is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Pitch generation is not configured (GEMINI_API_KEY is not set)"
+        )
+
     try:
-        result = await pipeline_run(user_id=req.user_id)
+        result = await pipeline_run(
+            user_id=req.user_id,
+            max_ads=req.max_ads,
+            max_pages=req.max_pages,
+            pitch_service=pitch_service,
+        )
         return PipelineRunResponse(**result)
 
     except Exception as e:
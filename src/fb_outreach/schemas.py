@@ -1,9 +1,35 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, MISSING
 from typing import List, Optional, Dict, Any, List
 from pydantic import BaseModel, Field
 from datetime import date
 import uuid
 
+# ----- Compact stored records -----
+class SlottedRecord:
+    """
+    Base for `@dataclass(slots=True)` records kept in the memory store.
+
+    Slots drop the per-instance __dict__. Records pickled before the switch
+    carry a plain dict state, so unpickling accepts both layouts and fills
+    fields missing from older records with their defaults.
+    """
+    __slots__ = ()
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            dict_state, slot_state = state
+            state = {**(dict_state or {}), **(slot_state or {})}
+        for f in fields(self):
+            if f.name in state:
+                value = state[f.name]
+            elif f.default is not MISSING:
+                value = f.default
+            elif f.default_factory is not MISSING:
+                value = f.default_factory()
+            else:
+                value = None
+            object.__setattr__(self, f.name, value)
+
 # ----- Pydantic models -----
 class Paging(BaseModel):
     next: Optional[str] = None
@@ -24,9 +50,25 @@ class AdsRequest(BaseModel):
     since: Optional[date] = Field(None, description="Start date (YYYY-MM-DD).")
     until: Optional[date] = Field(None, description="End date (YYYY-MM-DD).")
     access_token: str | None = Field(None, description="Facebook API access token.")
+    incremental: bool = Field(True, description="Only fetch/store ads newer than earlier runs of this search.")
 
-@dataclass
-class ApifyFacebookPageData:
+class PipelineRunRequest(BaseModel):
+    user_id: str = Field("default_user", description="User ID.")
+    max_ads: Optional[int] = Field(None, description="Stop after this many ads.")
+    max_pages: Optional[int] = Field(None, description="Stop after this many Ads Library pages.")
+
+class PipelineRunResponse(BaseModel):
+    total: int
+    success: int
+    failed: int
+    skipped: int
+    prospects: int
+    missing_email: int
+    time_to_first_pitch_seconds: Optional[float] = None
+    wall_seconds: Optional[float] = None
+
+@dataclass(slots=True)
+class ApifyFacebookPageData(SlottedRecord):
     # Core identifiers
     page_id: str
     facebook_id: Optional[str] = None
@@ -67,13 +109,15 @@ class ApifyFacebookPageData:
     # Ads & business info
     ad_status: Optional[str] = None
     is_business_page_active: Optional[bool] = None
+    # pageAdLibrary.id, the id ads reference as page_id
+    ad_library_page_id: Optional[str] = None
 
-    # Raw fallback (future safety)
+    # Raw fallback (future safety); a LazyPayload when loaded from the store
     raw_data: Optional[Dict[str, Any]] = None
 
 
-@dataclass
-class FacebookAdData:
+@dataclass(slots=True)
+class FacebookAdData(SlottedRecord):
     """Represents a single Facebook Ad from Ads Archive API."""
 
     # Core identifiers
@@ -91,19 +135,30 @@ class FacebookAdData:
     # URLs
     ad_snapshot_url: Optional[str] = None
 
-    # Raw fallback (safety for future API changes)
+    # Raw fallback (safety for future API changes); a LazyPayload when loaded from the store
     raw_data: Optional[Dict[str, Any]] = None
 
-@dataclass
-class FacebookAdsPaging:
+@dataclass(slots=True)
+class FacebookAdsPaging(SlottedRecord):
     after_cursor: Optional[str] = None
     next_url: Optional[str] = None
 
-@dataclass
-class FacebookAdsResponse:
+@dataclass(slots=True)
+class FacebookAdsResponse(SlottedRecord):
     ads: List[FacebookAdData] = field(default_factory=list)
     paging: Optional[FacebookAdsPaging] = None
 
+@dataclass(slots=True)
+class AdsQueryWatermark(SlottedRecord):
+    """
+    What one run learned about a saved search (see watermark_key).
+    Records are append-only deltas: a run stores only the ad ids it added, and
+    the effective watermark is the union of all deltas for the query.
+    """
+    query_key: str
+    last_delivery_date: Optional[str] = None
+    ad_ids: List[str] = field(default_factory=list)
+
 
 """
 Data models for the Facebook outreach pipeline.
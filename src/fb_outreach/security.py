@@ -40,14 +40,26 @@ def _patch_bcrypt():
 _patch_bcrypt()
 
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import os
 import uuid
 import time
 import base64
+import hashlib
+import hmac
 import json
+import secrets
 
 # Create a password context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt runs on its own bounded pool so hashing never blocks the event loop
+# and a login burst cannot take over the default asyncio.to_thread pool
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "4"))
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
 
 def hash_password(password: str) -> str:
     """
@@ -69,31 +81,96 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def hash_password_async(password: str) -> str:
+    """
+    hash_password on the bcrypt thread pool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    verify_password on the bcrypt thread pool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, verify_password, plain_password, hashed_password)
+
+
+class LoginGovernor:
+    """
+    Caps concurrent password checks.
+
+    At most `max_concurrent` logins verify at once; others wait up to
+    `max_wait_seconds` for a slot and are then rejected with 429, so a burst
+    of logins cannot queue unbounded bcrypt work ahead of everything else.
+    """
+
+    def __init__(self, max_concurrent: int = BCRYPT_WORKERS, max_wait_seconds: float = 5.0):
+        self.max_concurrent = max_concurrent
+        self.max_wait_seconds = max_wait_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=429, detail="Too many login attempts, please retry shortly")
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+login_governor = LoginGovernor(
+    max_concurrent=int(os.getenv("LOGIN_MAX_CONCURRENCY", str(BCRYPT_WORKERS))),
+    max_wait_seconds=float(os.getenv("LOGIN_MAX_WAIT_SECONDS", "5")),
+)
+
+
+# Tokens are signed with TOKEN_SECRET; without it a per-process key is used,
+# so tokens do not survive restarts or work across several workers
+TOKEN_SECRET = os.getenv("TOKEN_SECRET")
+if not TOKEN_SECRET:
+    print("Warning: TOKEN_SECRET is not set, using a random per-process signing key")
+    TOKEN_SECRET = secrets.token_urlsafe(32)
+_token_key = TOKEN_SECRET.encode()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload_b64: str) -> str:
+    return _b64encode(hmac.new(_token_key, payload_b64.encode(), hashlib.sha256).digest())
+
+
 def create_manual_token(user_id: str, expires_seconds: int = 3600) -> str:
     """
-    Creates a simple token containing user_id and expiry timestamp
+    Creates a signed token "<payload>.<signature>" containing user_id and expiry timestamp
     """
     payload = {
         "user_id": user_id,
         "iat": int(time.time()),  # issued at
         "exp": int(time.time()) + expires_seconds  # expiry timestamp
     }
-    # convert payload to JSON string
-    payload_str = json.dumps(payload)
-    
-    # encode to base64 to make it string-safe
-    token = base64.urlsafe_b64encode(payload_str.encode()).decode()
-    return token
+    # compact JSON, base64url without padding
+    payload_b64 = _b64encode(json.dumps(payload, separators=(",", ":")).encode())
+    return f"{payload_b64}.{_sign(payload_b64)}"
 
 def verify_manual_token(token: str) -> dict:
     """
-    Verifies the manual token and returns the payload if valid
+    Verifies the token signature (constant time) and expiry, returns the payload if valid
     """
     try:
-        # decode from base64
-        payload_str = base64.urlsafe_b64decode(token.encode()).decode()
-        payload = json.loads(payload_str)
-        
+        payload_b64, signature = token.split(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload_b64)):
+            raise ValueError("Bad signature")
+
+        payload = json.loads(_b64decode(payload_b64))
+
         # check expiry
         if payload["exp"] < int(time.time()):
             raise ValueError("Token expired")
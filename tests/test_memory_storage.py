@@ -0,0 +1,94 @@
+"""
+Compaction checks for the log and SQLite backends.
+
+Run with `python -m unittest discover tests` (or pytest) from the repo root.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fb_outreach.memory_storage import (  # noqa: E402
+    BufferItem,
+    LogSegment,
+    LogStorageBackend,
+    RetentionPolicy,
+    SQLiteStorageBackend,
+)
+from fb_outreach.schemas import AdsQueryWatermark  # noqa: E402
+
+
+class PipelineSessionModel:
+    """Stand-in routed to the sessions partition by class name."""
+
+    def __init__(self, status: str):
+        self.status = status
+
+
+class WatermarkRetentionTest(unittest.TestCase):
+    def check_backend(self, backend):
+        backend.append_many(
+            [BufferItem(data=AdsQueryWatermark(query_key="q", ad_ids=["a1"]), user_id="u", run_id="r0")]
+            + [
+                BufferItem(data=AdsQueryWatermark(query_key=f"other-{i}"), user_id="u", run_id=f"r{i}")
+                for i in range(1, 4)
+            ]
+        )
+        backend.compact(RetentionPolicy(max_records_per_user=1))
+        keys = [item.data.query_key for item in backend.query(user_id="u", data_type=AdsQueryWatermark)]
+        self.assertIn("q", keys)
+        self.assertEqual(len(keys), 4)
+
+    def test_log_backend_keeps_watermarks_under_cap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_backend(LogStorageBackend(os.path.join(tmp, "memory.pkl")))
+
+    def test_sqlite_backend_keeps_watermarks_under_cap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteStorageBackend(os.path.join(tmp, "memory.db"))
+            try:
+                self.check_backend(backend)
+            finally:
+                backend.close()
+
+
+class KeyedRewriteTest(unittest.TestCase):
+    def test_write_back_of_evicted_session_does_not_return(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "memory.sessions.pkl")
+            segment = LogSegment(path, keyed=True)
+            evicted = BufferItem(data=PipelineSessionModel("started"), user_id="u", run_id="r1")
+            kept = BufferItem(data=PipelineSessionModel("started"), user_id="u", run_id="r2")
+            segment.append_many([evicted, kept])
+
+            mark = segment.rewrite_mark()
+            evicted.data = PipelineSessionModel("completed")
+            segment.write_back([evicted])
+            tmp_file = segment.write_rewrite([kept], mark)
+            self.assertTrue(segment.finish_rewrite(tmp_file, [kept], mark))
+
+            self.assertEqual([item.run_id for item in segment.items()], ["r2"])
+            self.assertEqual([item.run_id for item in LogSegment(path, keyed=True).items()], ["r2"])
+
+    def test_write_back_of_kept_session_is_carried_over(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "memory.sessions.pkl")
+            segment = LogSegment(path, keyed=True)
+            kept = BufferItem(data=PipelineSessionModel("started"), user_id="u", run_id="r1")
+            segment.append_many([kept, BufferItem(data=PipelineSessionModel("started"), user_id="u", run_id="r0")])
+
+            mark = segment.rewrite_mark()
+            tmp_file = segment.write_rewrite([kept], mark)
+            kept.data = PipelineSessionModel("completed")
+            segment.write_back([kept])
+            self.assertTrue(segment.finish_rewrite(tmp_file, [kept], mark))
+
+            reloaded = LogSegment(path, keyed=True).items()
+            self.assertEqual([(item.run_id, item.data.status) for item in reloaded], [("r1", "completed")])
+
+
+if __name__ == "__main__":
+    unittest.main()